@@ -8,6 +8,8 @@ from .app import App
 class Command(str, Enum):
     REFRESH = "refresh"
     EXPORT = "export"
+    EXPLAIN = "explain"
+    SEARCH = "search"
     # TODO: Add command to list back ends
 
 
@@ -16,7 +18,17 @@ async def main():
     parser.add_argument(
         "command", choices=[command.value for command in Command], help="Command"
     )
+    parser.add_argument("query", nargs="?", default="", help="Search query")
+    parser.add_argument(
+        "--library",
+        choices=["spotify", "rekordbox"],
+        default="rekordbox",
+        help="Library to search",
+    )
+    parser.add_argument("--page", type=int, default=1, help="Search results page")
     args = parser.parse_args()
+    if args.page < 1:
+        parser.error("--page must be at least 1")
 
     async with App() as app:
         command = Command(args.command)
@@ -26,6 +38,10 @@ async def main():
             case Command.EXPORT:
                 # TODO: Allow user to specify source and target
                 await app.update(app.spotify, app.rekordbox)
+            case Command.EXPLAIN:
+                await app.explain()
+            case Command.SEARCH:
+                await app.search(args.library, args.query, page=args.page)
 
 
 if __name__ == "__main__":
@@ -3,13 +3,13 @@ import tempfile
 import time
 from pathlib import Path
 from types import TracebackType
-from typing import Optional, Self, Type
+from typing import List, Optional, Self, Type
 
 from .clients import TrackExportError
 from .database import Database
 from .libraries import Library, RekordboxLibrary, SpotifyLibrary
 from .logging import logger
-from .models import PlaylistStatus
+from .models import Track
 
 
 class App:
@@ -56,41 +56,80 @@ class App:
             for library in self._libraries.values():
                 tg.create_task(library.refresh())
 
+    async def explain(self) -> None:
+        """Log the query plans of the queries used to refresh and update libraries."""
+        for library in self._libraries.values():
+            for target in self._libraries.values():
+                if target is library:
+                    continue
+
+                for name, plan in (await library.explain(target)).items():
+                    plan = "\n".join(plan)
+                    logger.info(f"Query plan for {name} in {library}:\n{plan}")
+
+    async def search(self, library_name: str, query: str, page: int = 1) -> None:
+        """Log a page of tracks in LIBRARY_NAME matching QUERY."""
+        library = self._libraries[library_name]
+        tracks = await library.search(query, page=page)
+        if not tracks:
+            logger.info(f"No tracks in {library} match {query!r} on page {page}")
+
+        for track in tracks:
+            artist = track.artist or "Unknown artist"
+            album = f" [{track.album}]" if track.album else ""
+            logger.info(f"{artist} - {track.title}{album} ({track.external_id})")
+
+    async def _export_and_import(
+        self, source: type[Library], target: type[Library], tracks: List[type[Track]]
+    ) -> int:
+        """Export TRACKS from SOURCE and import them to TARGET.
+
+        Returns the number of tracks imported.
+        """
+        with tempfile.TemporaryDirectory() as export_directory:
+            export_directory = Path(export_directory)
+            export_track_tasks = []
+            for track in tracks:
+                task = source.export_track(track, export_directory)
+                export_track_tasks.append(task)
+
+            exported_paths = []
+            for task in asyncio.as_completed(export_track_tasks):
+                result = await task
+                if isinstance(result, TrackExportError):
+                    logger.debug(f"{result}")
+                else:
+                    exported_paths.append(result)
+
+            if not exported_paths:
+                return 0
+
+            # Duplicates of tracks already in TARGET are skipped
+            imported_tracks = await target.import_tracks(*exported_paths)
+
+        return len(imported_tracks)
+
     async def update(self, source: type[Library], target: type[Library]) -> None:
         """Update tracks and playlists TARGET to match SOURCE."""
         start_time = time.perf_counter()
         logger.info(f"Updating {source} to match {target}")
 
+        matched_count = await source.match_tracks(target)
+        logger.info(f"Matched {matched_count:,} tracks without an ISRC to {target}")
+
         logger.debug(f"Getting tracks in {source} not in {target}")
-        missing_tracks = await source.tracks_not_in(target)
-        if missing_tracks:
+        missing_count = 0
+        imported_count = 0
+        async for missing_tracks in source.tracks_not_in(target):
             logger.info(f"Exporting {len(missing_tracks)} tracks from {source}")
+            missing_count += len(missing_tracks)
+            imported_count += await self._export_and_import(
+                source, target, missing_tracks
+            )
 
-        with tempfile.TemporaryDirectory() as export_directory:
-            export_directory = Path(export_directory)
-            export_track_tasks = []
-            for track in missing_tracks:
-                task = source.export_track(track, export_directory)
-                export_track_tasks.append(task)
+        logger.info(f"Imported {imported_count:,}/{missing_count:,} tracks to {target}")
 
-            async with asyncio.TaskGroup() as tg:
-                num_exported = 0
-                for task in asyncio.as_completed(export_track_tasks):
-                    result = await task
-                    if isinstance(result, TrackExportError):
-                        logger.debug(f"{result}")
-                    else:
-                        num_exported += 1
-                        tg.create_task(target.import_track(result))
-
-        logger.info(
-            f"Imported {num_exported:,}/{len(missing_tracks):,} tracks to {target}"
-        )
-
-        source_playlists = await source.playlists.filter(status=PlaylistStatus.SYNCED)
-        async with asyncio.TaskGroup() as tg:
-            for source_playlist in source_playlists:
-                tg.create_task(target.update_playlist_to_match_source(source_playlist))
+        await target.update_playlists_to_match_source(source)
 
         end_time = time.perf_counter()
         time_elapsed = end_time - start_time
@@ -1,4 +1,4 @@
-from .abstract import Client, TrackExportError
+from .abstract import Client, TrackExportError, TrackImportError
 from .rekordbox import RekordboxClient
 from .spotify import SpotifyClient
 
@@ -7,4 +7,5 @@ __all__ = [
     "RekordboxClient",
     "SpotifyClient",
     "TrackExportError",
+    "TrackImportError",
 ]
@@ -1,8 +1,10 @@
+import contextlib
 from abc import ABC, abstractmethod
 from pathlib import Path
 from types import TracebackType
-from typing import AsyncGenerator, Optional, Self, Type
+from typing import AsyncGenerator, List, Optional, Self, Type
 
+from ..logging import logger
 from ..models import Playlist, Track
 
 
@@ -10,6 +12,10 @@ class TrackExportError(Exception):
     pass
 
 
+class TrackImportError(Exception):
+    pass
+
+
 class Client(ABC):
     """Class for interfacing with an external music library."""
 
@@ -38,6 +44,13 @@ class Client(ABC):
         """Close connection to external library."""
         pass
 
+    def snapshot(self) -> contextlib.AbstractAsyncContextManager:
+        """Return a context in which reads see a consistent view of the library.
+
+        Back ends without snapshot support read from the live library.
+        """
+        return contextlib.nullcontext()
+
     @abstractmethod
     async def get_playlists(self) -> AsyncGenerator[type[Playlist], None]:
         pass
@@ -61,6 +74,24 @@ class Client(ABC):
         """Import track at TRACK_PATH to external library."""
         pass
 
+    async def import_tracks(self, tracks: List[type[Track]]) -> List[type[Track]]:
+        """Import TRACKS to external library.
+
+        Defaults to importing each track individually, but can be overridden by back
+        ends that support batched imports. Returns the tracks imported, leaving out
+        those that failed with TrackImportError.
+        """
+        imported_tracks = []
+        for track in tracks:
+            try:
+                await self.import_track(track)
+            except TrackImportError as e:
+                logger.error(f"Failed to import {track}: {e}")
+            else:
+                imported_tracks.append(track)
+
+        return imported_tracks
+
     @abstractmethod
     async def update_playlist(self, playlist: type[Playlist]) -> None:
         """Update PLAYLIST on external library."""
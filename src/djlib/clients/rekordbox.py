@@ -1,103 +1,329 @@
 import asyncio
 import contextlib
-import shutil
-import threading
+import datetime
+import itertools
+import tempfile
+from bisect import bisect_left
+from collections import defaultdict, deque
 from pathlib import Path
-from typing import AsyncGenerator, List
+from typing import (
+    Any,
+    AsyncGenerator,
+    Callable,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+from uuid import uuid4
 
 from pyrekordbox import Rekordbox6Database
 from pyrekordbox.db6.tables import (
     DjmdAlbum,
+    DjmdArtist,
     DjmdContent,
+    DjmdPlaylist,
     DjmdSongPlaylist,
     PlaylistType,
 )
-from sqlalchemy import asc
+from sqlalchemy import (
+    Engine,
+    Row,
+    Select,
+    asc,
+    create_engine,
+    func,
+    select,
+    tuple_,
+)
 from sqlalchemy.exc import NoResultFound
-from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.orm import Session, aliased
 
+from ..config import Config
+from ..database import SQLITE_MAX_VARIABLES
+from ..files import copy_file
 from ..logging import logger
 from ..models import RekordboxPlaylist, RekordboxTrack
-from .abstract import Client
+from ..scheduler import Resource, scheduler
+from .abstract import Client, TrackImportError
+from .rekordbox_database import RekordboxDatabaseActor
+
+# Rows read and converted to tracks at a time by RekordboxClient.get_playlist_tracks
+PLAYLIST_TRACKS_CHUNK_SIZE = 500
+
+
+class PlaylistEditScript(NamedTuple):
+    """Edits needed to turn one playlist order into another.
+
+    DELETES and MOVES are positions in the current order, INSERTS are positions in
+    the target order. ORDER maps each target position to the current position of
+    the row that fills it, or None for inserted rows.
+    """
+
+    deletes: List[int]
+    inserts: List[int]
+    moves: List[int]
+    order: List[Optional[int]]
+
+
+def playlist_edit_script(current: List[int], target: List[int]) -> PlaylistEditScript:
+    """Return a minimal edit script turning the CURRENT content IDs into TARGET.
+
+    Repeated IDs are matched by occurrence. Matched rows that keep their relative
+    order (a longest increasing subsequence) stay put and the rest are moved.
+    """
+    positions = defaultdict(deque)
+    for i, content_id in enumerate(current):
+        positions[content_id].append(i)
+
+    order = []
+    for content_id in target:
+        try:
+            order.append(positions[content_id].popleft())
+        except IndexError:
+            order.append(None)
+
+    matched = [i for i in order if i is not None]
+    matched_set = set(matched)
+    kept = _longest_increasing_subsequence(matched)
+    return PlaylistEditScript(
+        deletes=[i for i in range(len(current)) if i not in matched_set],
+        inserts=[j for j, i in enumerate(order) if i is None],
+        moves=sorted(matched_set - kept),
+        order=order,
+    )
+
+
+def _longest_increasing_subsequence(values: List[int]) -> Set[int]:
+    tail_values = []  # Smallest tail value of each subsequence length
+    tail_indices = []
+    previous = [None] * len(values)
+    for i, value in enumerate(values):
+        length = bisect_left(tail_values, value)
+        if length:
+            previous[i] = tail_indices[length - 1]
+        if length == len(tail_values):
+            tail_values.append(value)
+            tail_indices.append(i)
+        else:
+            tail_values[length] = value
+            tail_indices[length] = i
+
+    result = set()
+    i = tail_indices[-1] if tail_indices else None
+    while i is not None:
+        result.add(values[i])
+        i = previous[i]
+
+    return result
+
+
+def _select_content_rows() -> Select:
+    """Select the DjmdContent columns used by RekordboxTrack.from_rb.
+
+    Artist, album and album artist names are joined in, so rows can be read as
+    plain tuples without loading the ORM relationship graph.
+    """
+    artist = aliased(DjmdArtist)
+    album_artist = aliased(DjmdArtist)
+    return (
+        select(
+            DjmdContent.ID,
+            DjmdContent.Title,
+            DjmdContent.TrackNo,
+            DjmdContent.DiscNo,
+            DjmdContent.FolderPath,
+            DjmdContent.Length,
+            DjmdContent.rb_local_usn,
+            artist.Name.label("ArtistName"),
+            DjmdAlbum.Name.label("AlbumName"),
+            album_artist.Name.label("AlbumArtistName"),
+        )
+        .outerjoin(artist, DjmdContent.ArtistID == artist.ID)
+        .outerjoin(DjmdAlbum, DjmdContent.AlbumID == DjmdAlbum.ID)
+        .outerjoin(album_artist, DjmdAlbum.AlbumArtistID == album_artist.ID)
+    )
 
 
 class RekordboxClient(Client):
     """Class for interfacing with a rekordbox library."""
 
-    # TODO: Make Rekordbox6Database async
+    _database_actor: Optional[RekordboxDatabaseActor] = None
+    _snapshot_engine: Optional[Engine] = None
+
+    async def _read(self, function: Callable[..., Any], *args: Any) -> Any:
+        """Run FUNCTION(session, *ARGS), using the snapshot database when available.
 
-    _rekordbox_database_semaphore = threading.Semaphore()
+        Snapshot sessions are independent of each other, so they run in worker
+        threads concurrently, up to the scheduler's database limit. Live reads are
+        queued on the database actor.
+        """
+        if self._snapshot_engine is None:
+            return await self._database_actor.read(
+                lambda db: function(db.session, *args)
+            )
 
-    def _open_db(self) -> contextlib.AbstractContextManager[Rekordbox6Database]:
-        @contextlib.contextmanager
-        def _context_manager():
-            with self._rekordbox_database_semaphore, self._rekordbox_database:
-                self._rekordbox_database.open()
-                yield self._rekordbox_database
+        def _snapshot_read():
+            with Session(bind=self._snapshot_engine) as session:
+                return function(session, *args)
 
-        return _context_manager()
+        async with scheduler.slot(Resource.DB):
+            return await asyncio.to_thread(_snapshot_read)
 
     async def connect(self) -> None:
         logger.debug(f"Starting {self}")
         # TODO: Download rekordbox db key
-        self._rekordbox_database = await asyncio.to_thread(Rekordbox6Database)
+        self._database_actor = RekordboxDatabaseActor(Rekordbox6Database)
+        await self._database_actor.start()
 
     async def close(self) -> None:
         logger.debug(f"Closing {self}")
-        if self._rekordbox_database.session:
-            self._rekordbox_database.close()
+        if self._database_actor is not None:
+            await self._database_actor.stop()
+            self._database_actor = None
+
+    @contextlib.asynccontextmanager
+    async def snapshot(self) -> AsyncGenerator[None, None]:
+        """Read from a private copy of master.db for the duration of the context.
+
+        Writes still go to the live database through the database actor.
+        """
+        if not Config.rekordbox_snapshot_reads:
+            yield
+            return
+
+        with tempfile.TemporaryDirectory() as snapshot_directory:
+            self._snapshot_engine = await self._database_actor.read(
+                self._create_snapshot, Path(snapshot_directory)
+            )
+            try:
+                yield
+            finally:
+                self._snapshot_engine.dispose()
+                self._snapshot_engine = None
+
+    @staticmethod
+    def _create_snapshot(db: Rekordbox6Database, snapshot_directory: Path) -> Engine:
+        live_engine = db.engine
+        database_path = Path(live_engine.url.database)
+        snapshot_path = snapshot_directory / database_path.name
+        logger.debug(f"Taking snapshot of {database_path}")
+        # The snapshot URL keeps the SQLCipher key, so both databases are encrypted
+        # alike and pages can be copied as they are
+        snapshot_engine = create_engine(
+            live_engine.url.set(database=str(snapshot_path)),
+            module=live_engine.dialect.dbapi,
+        )
+
+        # The backup API copies one consistent state of the database, including
+        # the WAL, however rekordbox writes to it meanwhile
+        live_connection = live_engine.raw_connection()
+        try:
+            snapshot_connection = snapshot_engine.raw_connection()
+            try:
+                live_connection.driver_connection.backup(
+                    snapshot_connection.driver_connection
+                )
+            finally:
+                snapshot_connection.close()
+        finally:
+            live_connection.close()
+
+        return snapshot_engine
 
     async def get_playlists(self) -> AsyncGenerator[RekordboxPlaylist, None]:
-        playlists = await asyncio.to_thread(self._get_playlists)
+        playlists = await self._read(self._get_playlists)
         for playlist in playlists:
             yield playlist
 
-    def _get_playlists(self) -> List[RekordboxPlaylist]:
-        results = []
-        with self._open_db():
+    @staticmethod
+    def _get_playlists(session: Session) -> List[RekordboxPlaylist]:
+        # Fingerprint every playlist with one aggregate query, so unchanged
+        # playlists can skip refreshing their tracks
+        query = (
+            select(
+                DjmdPlaylist.ID,
+                DjmdPlaylist.Name,
+                func.count(DjmdSongPlaylist.ID),
+                func.max(DjmdSongPlaylist.rb_local_usn),
+                func.max(DjmdContent.rb_local_usn),
+            )
+            .outerjoin(DjmdSongPlaylist, DjmdSongPlaylist.PlaylistID == DjmdPlaylist.ID)
+            .outerjoin(DjmdContent, DjmdContent.ID == DjmdSongPlaylist.ContentID)
             # Exclude folders and smart playlists
-            for db_playlist in self._rekordbox_database.get_playlist(
-                Attribute=PlaylistType.PLAYLIST
-            ):
-                results.append(
-                    RekordboxPlaylist(external_id=db_playlist.ID, name=db_playlist.Name)
-                )
-
-        return results
+            .where(DjmdPlaylist.Attribute == PlaylistType.PLAYLIST)
+            .group_by(DjmdPlaylist.ID)
+        )
+        return [
+            RekordboxPlaylist(
+                external_id=playlist_id,
+                name=name,
+                fingerprint=f"{count}:{max_song_usn}:{max_content_usn}",
+            )
+            for playlist_id, name, count, max_song_usn, max_content_usn in (
+                session.execute(query)
+            )
+        ]
 
     async def get_playlist_tracks(
         self, playlist: RekordboxPlaylist
     ) -> AsyncGenerator[RekordboxTrack, None]:
-        # TODO: Read ISRC tags concurrently
-        db_tracks = await asyncio.to_thread(self._get_playlist_contents, playlist)
-        for db_track in db_tracks:
-            yield await RekordboxTrack.from_rb(db_track)
-
-    def _get_playlist_contents(self, playlist: RekordboxPlaylist) -> List[DjmdContent]:
-        with self._open_db():
-            logger.debug(f"Getting playlist contents for {playlist}")
-            song_playlist_objects = (
-                self._rekordbox_database.query(DjmdSongPlaylist)
-                .options(
-                    joinedload(DjmdSongPlaylist.Content).joinedload(DjmdContent.Artist),
-                    joinedload(DjmdSongPlaylist.Content)
-                    .joinedload(DjmdContent.Album)
-                    .selectinload(DjmdAlbum.AlbumArtist),
-                )
-                .filter(DjmdSongPlaylist.PlaylistID == playlist.external_id)
-                .order_by(asc(DjmdSongPlaylist.TrackNo))
-                .all()
+        # Rows are read and converted a chunk at a time, so memory doesn't grow
+        # with the size of the playlist
+        after = None
+        while True:
+            db_tracks = await self._read(
+                self._get_playlist_contents,
+                playlist,
+                after,
+                PLAYLIST_TRACKS_CHUNK_SIZE,
+            )
+            for track in await RekordboxTrack.from_rb_rows(db_tracks):
+                yield track
+
+            if len(db_tracks) < PLAYLIST_TRACKS_CHUNK_SIZE:
+                return
+
+            after = (db_tracks[-1].PlaylistTrackNo, db_tracks[-1].SongPlaylistID)
+
+    @staticmethod
+    def _get_playlist_contents(
+        session: Session,
+        playlist: RekordboxPlaylist,
+        after: Optional[Tuple[int, str]],
+        limit: int,
+    ) -> List[Row]:
+        """Return up to LIMIT rows of PLAYLIST's tracks, in order, after AFTER.
+
+        AFTER is the (PlaylistTrackNo, SongPlaylistID) key of the last row read.
+        """
+        logger.debug(f"Getting playlist contents for {playlist}")
+        query = (
+            _select_content_rows()
+            .add_columns(
+                DjmdSongPlaylist.TrackNo.label("PlaylistTrackNo"),
+                DjmdSongPlaylist.ID.label("SongPlaylistID"),
+            )
+            .join(DjmdSongPlaylist, DjmdSongPlaylist.ContentID == DjmdContent.ID)
+            .where(DjmdSongPlaylist.PlaylistID == playlist.external_id)
+            .order_by(asc(DjmdSongPlaylist.TrackNo), asc(DjmdSongPlaylist.ID))
+            .limit(limit)
+        )
+        if after is not None:
+            query = query.where(
+                tuple_(DjmdSongPlaylist.TrackNo, DjmdSongPlaylist.ID) > tuple_(*after)
             )
-            return [song_playlist.Content for song_playlist in song_playlist_objects]
+
+        return session.execute(query).all()
 
     async def export_track(
         self, track: type[RekordboxTrack], export_directory: Path
     ) -> Path:
         logger.debug(f"Exporting {track} to {export_directory}")
-        await asyncio.to_thread(
-            shutil.copy,
-            track.path,
-            export_directory / f"{track.isrc}{track.path.suffix}",
+        track_path = Path(track.path)
+        return await copy_file(
+            track_path, export_directory / f"{track.isrc}{track_path.suffix}"
         )
 
     async def import_track(self, track: RekordboxTrack) -> None:
@@ -107,81 +333,246 @@ class RekordboxClient(Client):
             logger.warning(f"Track already exists at {non_unique_import_path}")
 
         import_path = track.import_path(unique=True)
-        logger.debug(f"Moving {track.path} to {import_path}")
-        await asyncio.to_thread(import_path.parent.mkdir, parents=True, exist_ok=True)
-        await asyncio.to_thread(track.path.rename, import_path)
-        track.path = import_path
-        db_track_id = await asyncio.to_thread(self._save_track, track)
+        await self._move_track(track, import_path)
+        (db_track_id,) = await self._database_actor.write(self._save_tracks, [track])
         track.external_id = db_track_id
 
-    def _save_track(self, track: RekordboxTrack) -> str:
-        with self._open_db():
-            db_track = self._rekordbox_database.add_content(
-                track.path, Title=track.title
+    async def import_tracks(self, tracks: List[RekordboxTrack]) -> List[RekordboxTrack]:
+        """Import TRACKS to rekordbox, adding them to the database in one commit.
+
+        Tracks whose files can't be moved are left out of the commit and the
+        returned list of imported tracks.
+        """
+        if not tracks:
+            return []
+
+        logger.debug(f"Importing {len(tracks):,} tracks")
+        import_paths = await asyncio.to_thread(self._resolve_import_paths, tracks)
+        source_paths = [track.path for track in tracks]
+        async with asyncio.TaskGroup() as tg:
+            move_tasks = [
+                tg.create_task(self._try_move_track(track, import_path))
+                for track, import_path in zip(tracks, import_paths)
+            ]
+
+        moved = [task.result() for task in move_tasks]
+        moved_tracks = [track for track, is_moved in zip(tracks, moved) if is_moved]
+        if not moved_tracks:
+            return []
+
+        try:
+            db_track_ids = await self._database_actor.write(
+                self._save_tracks, moved_tracks
             )
-            self._rekordbox_database.commit()
-            return db_track.ID
+        except Exception:
+            # Put the files back, so none are left moved without a rekordbox row
+            for track, source_path, is_moved in zip(tracks, source_paths, moved):
+                if is_moved:
+                    await asyncio.to_thread(track.path.rename, source_path)
+                    track.path = source_path
+            raise
+
+        for track, db_track_id in zip(moved_tracks, db_track_ids):
+            track.external_id = db_track_id
+
+        return moved_tracks
+
+    def _resolve_import_paths(self, tracks: List[RekordboxTrack]) -> List[Path]:
+        # List each destination directory once instead of probing every
+        # candidate path with exists()
+        taken = set()
+        listed_directories = set()
+        import_paths = []
+        for track in tracks:
+            non_unique_import_path = track.import_path()
+            directory = non_unique_import_path.parent
+            if directory not in listed_directories:
+                listed_directories.add(directory)
+                if directory.is_dir():
+                    taken.update(directory.iterdir())
+
+            if non_unique_import_path in taken:
+                logger.warning(f"Track already exists at {non_unique_import_path}")
+
+            import_path = track.import_path(unique=True, taken=taken)
+            taken.add(import_path)
+            import_paths.append(import_path)
+
+        return import_paths
+
+    async def _try_move_track(self, track: RekordboxTrack, import_path: Path) -> bool:
+        try:
+            await self._move_track(track, import_path)
+        except TrackImportError as e:
+            logger.error(f"Failed to import {track}: {e}")
+            return False
+
+        return True
+
+    async def _move_track(self, track: RekordboxTrack, import_path: Path) -> None:
+        logger.debug(f"Moving {track.path} to {import_path}")
+        try:
+            await asyncio.to_thread(
+                import_path.parent.mkdir, parents=True, exist_ok=True
+            )
+            await asyncio.to_thread(track.path.rename, import_path)
+        except OSError as e:
+            raise TrackImportError(f"Failed to move {track.path}: {e}") from e
+
+        track.path = import_path
+
+    @staticmethod
+    def _save_tracks(db: Rekordbox6Database, tracks: List[RekordboxTrack]) -> List[str]:
+        db_tracks = [db.add_content(track.path, Title=track.title) for track in tracks]
+        db.flush()
+        return [db_track.ID for db_track in db_tracks]
 
     async def update_playlist(self, playlist: RekordboxPlaylist) -> None:
         """Update PLAYLIST in rekordbox."""
         logger.debug(f"Updating {playlist}")
         local_song_ids = await playlist.tracks.values_list("external_id", flat=True)
         local_song_ids = [int(local_id) for local_id in local_song_ids]
-        playlist_tracks = await playlist.tracks.all()
-        await asyncio.to_thread(
-            self._update_playlist, playlist, local_song_ids, playlist_tracks
+        await self._database_actor.write(
+            self._update_playlist, playlist, local_song_ids
         )
 
-    def _update_playlist(self, playlist, local_song_ids, playlist_tracks) -> None:
-        with self._open_db():
-            try:
-                db_playlist = self._rekordbox_database.get_playlist(
-                    Name=playlist.name, Attribute=PlaylistType.PLAYLIST
-                ).one()
-            except NoResultFound:
-                db_playlist = self._rekordbox_database.create_playlist(playlist.name)
-                logger.debug(f"Created playlist on rekordbox: {playlist.name}")
-                self._rekordbox_database.commit()
-
-            db_songs = sorted(db_playlist.Songs, key=lambda s: s.TrackNo)
-            db_song_ids = [int(s.Content.ID) for s in db_songs]
-
-            if db_song_ids != local_song_ids:
-                logger.debug(f"Removing existing playlist tracks for {playlist}")
-                for song in db_playlist.Songs:
-                    self._rekordbox_database.remove_from_playlist(db_playlist, song)
-
-                logger.debug(f"Adding new playlist tracks for {playlist}")
-                for track in playlist_tracks:
-                    db_track = self._rekordbox_database.get_content(
-                        ID=track.external_id
-                    )
-                    if db_track:
-                        self._rekordbox_database.add_to_playlist(db_playlist, db_track)
-
-                logger.debug(f"Committing {playlist} changes to rekordbox")
-                self._rekordbox_database.commit()
-            else:
-                logger.debug(f"{playlist} is already up to date")
-
-    async def get_non_playlist_tracks(self) -> AsyncGenerator[RekordboxTrack, None]:
-        non_playlist_tracks = await asyncio.to_thread(self._get_non_playlist_tracks)
-        for db_track in non_playlist_tracks:
-            yield await RekordboxTrack.from_rb(db_track)
-
-    def _get_non_playlist_tracks(self) -> List[RekordboxTrack]:
-        with self._open_db():
-            # Query DjmdContent and eagerly load Artist, Album, and AlbumArtist
-            # to prevent DetachedInstanceError when accessing relations later
-            query = (
-                self._rekordbox_database.query(DjmdContent)
-                .options(
-                    selectinload(DjmdContent.Artist),
-                    selectinload(DjmdContent.Album).selectinload(DjmdAlbum.AlbumArtist),
-                )
-                .outerjoin(
-                    DjmdSongPlaylist, DjmdContent.ID == DjmdSongPlaylist.ContentID
-                )
-                .filter(DjmdSongPlaylist.ID.is_(None))
+    @classmethod
+    def _update_playlist(
+        cls, db: Rekordbox6Database, playlist: RekordboxPlaylist, local_song_ids
+    ) -> None:
+        try:
+            db_playlist = db.get_playlist(
+                Name=playlist.name, Attribute=PlaylistType.PLAYLIST
+            ).one()
+        except NoResultFound:
+            db_playlist = db.create_playlist(playlist.name)
+            logger.debug(f"Created playlist on rekordbox: {playlist.name}")
+
+        db_songs = sorted(db_playlist.Songs, key=lambda s: s.TrackNo)
+        db_song_ids = [int(s.ContentID) for s in db_songs]
+
+        existing_ids = cls._existing_content_ids(db, set(local_song_ids))
+        local_song_ids = [i for i in local_song_ids if i in existing_ids]
+
+        if db_song_ids != local_song_ids:
+            script = playlist_edit_script(db_song_ids, local_song_ids)
+            logger.debug(
+                f"Updating {playlist} on rekordbox: {len(script.deletes)} "
+                f"deletes, {len(script.inserts)} inserts, {len(script.moves)} moves"
+            )
+            cls._apply_playlist_edit_script(
+                db, db_playlist, db_songs, local_song_ids, script
+            )
+        else:
+            logger.debug(f"{playlist} is already up to date")
+
+    @staticmethod
+    def _existing_content_ids(
+        db: Rekordbox6Database, content_ids: Set[int]
+    ) -> Set[int]:
+        existing_ids = set()
+        for batch in itertools.batched(content_ids, SQLITE_MAX_VARIABLES):
+            query = db.query(DjmdContent.ID).filter(
+                DjmdContent.ID.in_([str(content_id) for content_id in batch])
             )
-            return query.all()
+            existing_ids.update(int(content_id) for (content_id,) in query)
+
+        return existing_ids
+
+    @staticmethod
+    def _apply_playlist_edit_script(
+        db: Rekordbox6Database,
+        db_playlist: DjmdPlaylist,
+        db_songs: List[DjmdSongPlaylist],
+        content_ids: List[int],
+        script: PlaylistEditScript,
+    ) -> None:
+        now = datetime.datetime.now()
+        for i in script.deletes:
+            db.delete(db_songs[i])
+
+        songs = []
+        for track_no, (content_id, i) in enumerate(
+            zip(content_ids, script.order), start=1
+        ):
+            if i is None:
+                song = DjmdSongPlaylist.create(
+                    ID=str(uuid4()),
+                    PlaylistID=str(db_playlist.ID),
+                    ContentID=str(content_id),
+                    TrackNo=track_no,
+                    UUID=str(uuid4()),
+                    created_at=now,
+                    updated_at=now,
+                )
+                db.add(song)
+            else:
+                song = db_songs[i]
+
+            songs.append(song)
+
+        # Renumber surviving rows in a single pass, registering one move
+        moved = []
+        with db.registry.disabled():
+            for track_no, song in enumerate(songs, start=1):
+                if song.TrackNo != track_no:
+                    song.TrackNo = track_no
+                    song.updated_at = now
+                    moved.append(song)
+
+        if moved:
+            db.registry.on_move(moved)
+
+    async def get_non_playlist_tracks(
+        self, since_usn: Optional[int] = None
+    ) -> AsyncGenerator[RekordboxTrack, None]:
+        """Yield tracks that aren't in any playlist.
+
+        If SINCE_USN is given, only tracks changed after that USN are yielded.
+        """
+        non_playlist_tracks = await self._read(self._get_non_playlist_tracks, since_usn)
+        for track in await RekordboxTrack.from_rb_rows(non_playlist_tracks):
+            yield track
+
+    @staticmethod
+    def _get_non_playlist_tracks(
+        session: Session, since_usn: Optional[int] = None
+    ) -> List[Row]:
+        query = (
+            _select_content_rows()
+            .outerjoin(DjmdSongPlaylist, DjmdContent.ID == DjmdSongPlaylist.ContentID)
+            .where(DjmdSongPlaylist.ID.is_(None))
+        )
+        if since_usn is not None:
+            query = query.where(DjmdContent.rb_local_usn > since_usn)
+
+        return session.execute(query).all()
+
+    async def get_non_playlist_track_ids(self) -> Set[str]:
+        """Return the IDs of all tracks that aren't in any playlist."""
+        return await self._read(self._get_non_playlist_track_ids)
+
+    @staticmethod
+    def _get_non_playlist_track_ids(session: Session) -> Set[str]:
+        query = (
+            session.query(DjmdContent.ID)
+            .outerjoin(DjmdSongPlaylist, DjmdContent.ID == DjmdSongPlaylist.ContentID)
+            .filter(DjmdSongPlaylist.ID.is_(None))
+        )
+        return {content_id for (content_id,) in query}
+
+    async def get_database_state(self) -> Tuple[int, str]:
+        """Return the local USN and a file fingerprint of master.db."""
+        return await self._database_actor.read(self._get_database_state)
+
+    @staticmethod
+    def _get_database_state(db: Rekordbox6Database) -> Tuple[int, str]:
+        database_path = Path(db.engine.url.database)
+        wal_path = database_path.with_name(database_path.name + "-wal")
+        fingerprint_parts = []
+        for path in (database_path, wal_path):
+            if path.exists():
+                stat = path.stat()
+                fingerprint_parts.append(f"{stat.st_mtime_ns}:{stat.st_size}")
+
+        return db.get_local_usn(), "/".join(fingerprint_parts)
@@ -0,0 +1,203 @@
+import asyncio
+import queue
+import threading
+from typing import Any, Callable, List, NamedTuple, Optional, Tuple
+
+from pyrekordbox import Rekordbox6Database
+
+from ..logging import logger
+
+# Maximum number of queued write jobs committed together
+WRITE_BATCH_SIZE = 100
+
+
+class _Job(NamedTuple):
+    function: Callable[..., Any]
+    args: tuple
+    write: bool
+    future: asyncio.Future
+    loop: asyncio.AbstractEventLoop
+
+
+class RekordboxDatabaseActor:
+    """Thread that owns one open rekordbox database session.
+
+    Jobs are functions called with the open Rekordbox6Database followed by their
+    arguments. Reads run one at a time as they arrive. Writes queued back to back
+    are run together and committed once, each in its own savepoint so a failing
+    job is rolled back without the others.
+    """
+
+    def __init__(self, database_factory: Callable[[], Rekordbox6Database]):
+        self._database_factory = database_factory
+        self._database: Optional[Rekordbox6Database] = None
+        self._jobs: queue.SimpleQueue[Optional[_Job]] = queue.SimpleQueue()
+        # Set once the thread stops taking jobs, guarded by the lock so no job is
+        # queued after the last ones are failed
+        self._stopped = False
+        self._stopped_lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run, name="rekordbox-database", daemon=True
+        )
+
+    def __str__(self) -> str:
+        return f"<{self.__class__.__name__}>"
+
+    @property
+    def database(self) -> Rekordbox6Database:
+        return self._database
+
+    async def start(self) -> None:
+        self._thread.start()
+        await self.read(self._open)
+
+    async def stop(self) -> None:
+        if not self._stopped:
+            await self.read(self._close)
+            self._jobs.put(None)
+
+        await asyncio.to_thread(self._thread.join)
+
+    async def read(self, function: Callable[..., Any], *args: Any) -> Any:
+        """Run FUNCTION(database, *ARGS) on the database thread."""
+        return await self._submit(function, args, write=False)
+
+    async def write(self, function: Callable[..., Any], *args: Any) -> Any:
+        """Run FUNCTION(database, *ARGS) on the database thread and commit it."""
+        return await self._submit(function, args, write=True)
+
+    def _submit(self, function, args, write) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._stopped_lock:
+            if self._stopped:
+                future.set_exception(self._stopped_error())
+            else:
+                self._jobs.put(_Job(function, args, write, future, loop))
+        return future
+
+    def _stopped_error(self) -> RuntimeError:
+        return RuntimeError(f"{self} has stopped")
+
+    def _open(self, database: None) -> None:
+        self._database = self._database_factory()
+
+    def _close(self, database: Rekordbox6Database) -> None:
+        if database.session:
+            database.close()
+
+    def _run(self) -> None:
+        backlog = []
+        try:
+            while True:
+                job = backlog.pop(0) if backlog else self._jobs.get()
+                if job is None:
+                    break
+
+                if not job.write:
+                    self._run_read(job)
+                    continue
+
+                # Coalesce writes that are already queued into one commit
+                batch = [job]
+                while len(batch) < WRITE_BATCH_SIZE:
+                    try:
+                        next_job = self._jobs.get_nowait()
+                    except queue.Empty:
+                        break
+
+                    if next_job is None or not next_job.write:
+                        backlog.append(next_job)
+                        break
+
+                    batch.append(next_job)
+
+                self._run_writes(batch)
+        finally:
+            # Fail jobs that will never run, if the thread is dying
+            with self._stopped_lock:
+                self._stopped = True
+                while True:
+                    try:
+                        backlog.append(self._jobs.get_nowait())
+                    except queue.Empty:
+                        break
+
+            for job in backlog:
+                if job is not None:
+                    self._reject(job, self._stopped_error())
+
+    def _run_read(self, job: _Job) -> None:
+        outcome = (None, self._stopped_error())
+        try:
+            outcome = (job.function(self._database, *job.args), None)
+        except Exception as e:
+            outcome = (None, e)
+        finally:
+            self._settle(job, *outcome)
+            # End the read transaction so rekordbox isn't locked out between jobs
+            if self._database is not None and self._database.session is not None:
+                self._database.rollback()
+
+    def _run_writes(self, jobs: List[_Job]) -> None:
+        outcomes = [(None, self._stopped_error())] * len(jobs)
+        try:
+            self._begin()
+            write_outcomes = [self._run_write(job) for job in jobs]
+            self._database.commit()
+        except Exception as e:
+            # The commit failed, so none of the writes were saved
+            self._database.rollback()
+            outcomes = [(None, e)] * len(jobs)
+        else:
+            logger.debug(f"Committed {len(jobs)} writes in {self}")
+            outcomes = write_outcomes
+        finally:
+            for job, outcome in zip(jobs, outcomes):
+                self._settle(job, *outcome)
+
+    def _begin(self) -> None:
+        # pysqlite doesn't BEGIN before a SAVEPOINT, which would then start the
+        # transaction itself and commit the first job as soon as it's released
+        connection = self._database.session.connection()
+        if not connection.connection.dbapi_connection.in_transaction:
+            connection.exec_driver_sql("BEGIN")
+
+    def _run_write(self, job: _Job) -> Tuple[Any, Optional[Exception]]:
+        # Changes tracked for the USN bumps applied on commit, which the savepoint
+        # doesn't roll back
+        update_sequence = self._database.registry.__update_sequence__
+        tracked_updates = len(update_sequence)
+        savepoint = self._database.session.begin_nested()
+        try:
+            result = job.function(self._database, *job.args)
+        except Exception as e:
+            savepoint.rollback()
+            del update_sequence[tracked_updates:]
+            return None, e
+
+        savepoint.commit()
+        return result, None
+
+    @classmethod
+    def _settle(cls, job: _Job, result: Any, exception: Optional[Exception]) -> None:
+        if exception is not None:
+            cls._reject(job, exception)
+        else:
+            cls._resolve(job, result)
+
+    @staticmethod
+    def _resolve(job: _Job, result: Any) -> None:
+        def _set_result():
+            if not job.future.cancelled():
+                job.future.set_result(result)
+
+        job.loop.call_soon_threadsafe(_set_result)
+
+    @staticmethod
+    def _reject(job: _Job, exception: Exception) -> None:
+        def _set_exception():
+            if not job.future.cancelled():
+                job.future.set_exception(exception)
+
+        job.loop.call_soon_threadsafe(_set_exception)
@@ -1,10 +1,11 @@
 import asyncio
+import itertools
 import random
 import time
 from concurrent.futures import ProcessPoolExecutor
 from io import BytesIO
 from pathlib import Path
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Dict, List
 
 import httpx
 from librespot.audio.decoders import AudioQuality, VorbisOnlyAudioQuality
@@ -26,13 +27,14 @@ from mutagen.id3 import (
 )
 from pydub import AudioSegment
 
+from .. import fingerprint
 from ..config import Config
 from ..logging import logger
 from ..models import SpotifyPlaylist, SpotifyTrack
+from ..scheduler import Resource, scheduler
 from .abstract import Client, TrackExportError
 
 SPOTIFY_API_URL = "https://api.spotify.com/v1/"
-CONCURRENT_API_CALLS = 1
 CONCURRENT_DOWNLOADS = 1
 DOWNLOAD_RETRIES = 10
 DOWNLOAD_RETRY_BASE_WAIT_TIME = 1  # seconds
@@ -40,6 +42,9 @@ TRACK_STREAM_LOCK_DURATION = 1  # seconds
 
 CHUNK_SIZE = 65_536
 
+# Most track IDs accepted by the tracks endpoint
+RELINK_BATCH_SIZE = 50
+
 
 class InvalidSpotifyTrackData(Exception):
     pass
@@ -48,7 +53,6 @@ class InvalidSpotifyTrackData(Exception):
 class SpotifyClient(Client):
     """Class for interfacing with a Spotify library."""
 
-    _api_semaphore = asyncio.Semaphore(CONCURRENT_API_CALLS)
     _track_stream_semaphore = asyncio.Semaphore(CONCURRENT_DOWNLOADS)
     _last_track_stream_failure = 0
 
@@ -115,7 +119,7 @@ class SpotifyClient(Client):
             endpoint = SPOTIFY_API_URL + endpoint
 
         token = self._librespot_session.tokens().get("playlist-read-private")
-        async with self._api_semaphore:
+        async with scheduler.slot(Resource.API):
             response = await self._httpx_client.get(
                 endpoint, headers={"Authorization": f"Bearer {token}"}
             )
@@ -128,17 +132,35 @@ class SpotifyClient(Client):
 
         return response.json()
 
-    async def _api_items(self, endpoint: str) -> AsyncGenerator[dict, None]:
+    async def _api_pages(self, endpoint: str) -> AsyncGenerator[List[dict], None]:
+        """Yield the items of each page of ENDPOINT.
+
+        The next page is requested before a page is yielded, so it downloads while
+        the caller handles the current one.
+        """
         response = await self._api_request(endpoint)
         while True:
-            for item in response["items"]:
-                yield item
-
+            next_page = None
             if response["next"]:
-                response = await self._api_request(response["next"])
-            else:
+                next_page = asyncio.create_task(self._api_request(response["next"]))
+
+            try:
+                yield response["items"]
+            except BaseException:
+                if next_page is not None:
+                    next_page.cancel()
+                raise
+
+            if next_page is None:
                 break
 
+            response = await next_page
+
+    async def _api_items(self, endpoint: str) -> AsyncGenerator[dict, None]:
+        async for items in self._api_pages(endpoint):
+            for item in items:
+                yield item
+
     async def get_playlists(self) -> AsyncGenerator[SpotifyPlaylist, None]:
         async for item in self._api_items("me/playlists"):
             yield SpotifyPlaylist(
@@ -150,14 +172,15 @@ class SpotifyClient(Client):
     async def get_playlist_tracks(
         self, playlist: SpotifyPlaylist
     ) -> AsyncGenerator[SpotifyTrack, None]:
-        items = []
-        async for item in self._api_items(
+        # Tracks are yielded a page at a time, as pages arrive
+        async for items in self._api_pages(
             f"playlists/{playlist.external_id}/tracks?market=US"
             "&fields=items("
             "track(id,"
             "name,"
             "track_number,"
             "disc_number,"
+            "duration_ms,"
             "is_playable,"
             "external_ids(isrc),"
             "artists(name),"
@@ -166,42 +189,38 @@ class SpotifyClient(Client):
             ",is_local),"
             "next"
         ):
-            if item["track"]:
-                items.append(item)
-
-        # Collect relinked tracks
-        relinked_track_ids = []
-        for item in items:
-            if "linked_from" in item["track"]:
-                relinked_track_ids.append(item["track"]["id"])
-
-        relinked_items_map = {}
+            items = [item for item in items if item["track"]]
+            relinked_items_map = await self._get_relinked_items(playlist, items)
+            for item in items:
+                item = relinked_items_map.get(item["track"]["id"], item)
+                try:
+                    yield self._track_from_api_item(item)
+                except InvalidSpotifyTrackData as e:
+                    logger.warning(str(e))
+                    continue
+
+    async def _get_relinked_items(
+        self, playlist: SpotifyPlaylist, items: List[dict]
+    ) -> Dict[str, dict]:
+        """Return API items for the relinked tracks in ITEMS, by track ID."""
+        relinked_track_ids = [
+            item["track"]["id"] for item in items if "linked_from" in item["track"]
+        ]
         if relinked_track_ids:
             logger.debug(f"Relinking {len(relinked_track_ids)} tracks in {playlist}")
 
-        # Pull metadata for relinked tracks in batches of 100
-        for i in range(0, len(relinked_track_ids), 99):
-            if track_ids := relinked_track_ids[i : 1 + 99]:
-                relinked_items = await self._api_request(
-                    f"tracks?ids={','.join(track_ids)}&market=US"
-                )
-                for item in relinked_items["tracks"]:
-                    relinked_items_map[item["id"]] = {
-                        "track": item,
-                        "is_local": item["is_local"],
-                    }
-
-        for item in items:
-            try:
-                item = relinked_items_map[item["track"]["id"]]
-            except KeyError:
-                pass
+        relinked_items_map = {}
+        for track_ids in itertools.batched(relinked_track_ids, RELINK_BATCH_SIZE):
+            relinked_items = await self._api_request(
+                f"tracks?ids={','.join(track_ids)}&market=US"
+            )
+            for item in relinked_items["tracks"]:
+                relinked_items_map[item["id"]] = {
+                    "track": item,
+                    "is_local": item["is_local"],
+                }
 
-            try:
-                yield self._track_from_api_item(item)
-            except InvalidSpotifyTrackData as e:
-                logger.warning(str(e))
-                continue
+        return relinked_items_map
 
     def _track_from_api_item(self, item: dict) -> SpotifyTrack:
         if not item["track"]:
@@ -253,6 +272,7 @@ class SpotifyClient(Client):
             track_number=track_number,
             disc_number=disc_number,
             isrc=isrc,
+            duration=item["track"].get("duration_ms"),
             is_local=item["is_local"],
             is_playable=item["track"].get("is_playable"),
             album_art_url=album_art_url,
@@ -308,6 +328,14 @@ class SpotifyClient(Client):
             parameters=["-q:a", "0"],
         )
 
+        # Fingerprint the decoded audio while it's at hand, so importers can spot
+        # duplicates without decoding the export again
+        audio_fingerprint = None
+        if fingerprint.available():
+            audio_fingerprint = await asyncio.to_thread(
+                fingerprint.fingerprint_audio, audio
+            )
+
         logger.debug(f"Setting ID3 tags on {track}")
         audio = ID3(export_path)
         audio.add(TIT2(text=track.title, encoding=Encoding.UTF8))
@@ -328,6 +356,8 @@ class SpotifyClient(Client):
 
         audio.add(TSRC(text=track.isrc, encoding=Encoding.UTF8))
         audio.add(TXXX(desc="spotify_uris", text=track.external_id))
+        if audio_fingerprint is not None:
+            audio.add(fingerprint.fingerprint_tag(audio_fingerprint))
 
         if track.album_art_url:
             logger.debug(f"Getting album art for {track}")
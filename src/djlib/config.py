@@ -1,5 +1,6 @@
 import logging
 from pathlib import Path
+from typing import Dict, Union
 
 from platformdirs import user_cache_dir, user_music_dir
 
@@ -8,4 +9,14 @@ class Config:
     cache_directory: Path = Path(user_cache_dir("djlib", ensure_exists=True))
     log_level: int = logging.DEBUG
     database_file: str = "db.sqlite3"
+    # PRAGMAs set on every database connection
+    database_pragmas: Dict[str, Union[int, str]] = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -65_536,  # KiB
+        "mmap_size": 268_435_456,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5_000,  # ms
+    }
     music_directory: Path = Path(user_music_dir()) / "djlib"
+    rekordbox_snapshot_reads: bool = True
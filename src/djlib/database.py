@@ -1,11 +1,171 @@
+import asyncio
+import itertools
+import json
+import time
 from types import TracebackType
-from typing import Optional, Self, Type
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Collection,
+    List,
+    Optional,
+    Self,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
 
-from tortoise import Tortoise
+from tortoise import BaseDBAsyncClient, Tortoise, transactions
+from tortoise.models import Model
+from tortoise.queryset import QuerySet
 
 from .config import Config
 from .logging import logger
 
+# Lowest SQLITE_MAX_VARIABLE_NUMBER of supported SQLite builds
+SQLITE_MAX_VARIABLES = 999
+
+# Most writes grouped into one WriteQueue transaction, and the longest a write
+# waits for others to join it
+WRITE_BATCH_SIZE = 200
+WRITE_BATCH_DELAY = 0.05  # seconds
+
+T = TypeVar("T")
+
+
+async def _backfill_isrc_keys(connection: BaseDBAsyncClient) -> None:
+    from .models import pack_isrc
+
+    for table in ("rekordboxtrack", "spotifytrack"):
+        _, rows = await connection.execute_query(
+            f'SELECT "id", "isrc" FROM "{table}" WHERE "isrc" IS NOT NULL'
+        )
+        await connection.execute_many(
+            f'UPDATE "{table}" SET "isrc_key" = ? WHERE "id" = ?',
+            [[pack_isrc(row["isrc"]), row["id"]] for row in rows],
+        )
+
+
+# Schema changes for databases created by earlier versions of the models, applied
+# in order and tracked with PRAGMA user_version. Changes that can't be written in
+# SQL are async functions taking the connection.
+MIGRATIONS = [
+    'ALTER TABLE "rekordboxtrack" ADD COLUMN "rb_local_usn" BIGINT',
+    'ALTER TABLE "rekordboxplaylist" ADD COLUMN "fingerprint" VARCHAR(255)',
+    # Spread dense playlist track indices out into sparse sort keys, negating
+    # them first so no intermediate row clashes with the unique index
+    'UPDATE "rekordboxplaylisttrack" SET "index" = -("index" + 1) * 1024; '
+    'UPDATE "rekordboxplaylisttrack" SET "index" = -"index"',
+    'UPDATE "spotifyplaylisttrack" SET "index" = -("index" + 1) * 1024; '
+    'UPDATE "spotifyplaylisttrack" SET "index" = -"index"',
+    'ALTER TABLE "rekordboxtrack" ADD COLUMN "isrc_key" BIGINT; '
+    'ALTER TABLE "spotifytrack" ADD COLUMN "isrc_key" BIGINT',
+    _backfill_isrc_keys,
+    'ALTER TABLE "rekordboxtrack" ADD COLUMN "duration" INT; '
+    'ALTER TABLE "spotifytrack" ADD COLUMN "duration" INT',
+    'ALTER TABLE "rekordboxtrack" ADD COLUMN "audio_fingerprint" BLOB',
+]
+
+
+def _hot_query_indexes(model: type[Model]) -> List[Tuple[str, ...]]:
+    # Indexes for hot queries. They can't be declared in the Meta of the abstract
+    # models, which isn't inherited.
+    from .models import PlaylistTrack, Track
+
+    if issubclass(model, PlaylistTrack):
+        return [("playlist_id", "index"), ("track_id",)]
+
+    if issubclass(model, Track):
+        return [("isrc",), ("isrc_key",)]
+
+    return []
+
+
+async def create_indexes(model: type[Model], table: Optional[str] = None) -> None:
+    """Create the hot query indexes of MODEL on TABLE if they're missing.
+
+    TABLE defaults to the model's table. Index names get a numbered suffix when
+    taken, so a shadow table can be indexed while the live table still exists.
+    """
+    connection = Tortoise.get_connection("default")
+    table = table or model._meta.db_table
+    existing_indexes = set()
+    _, rows = await connection.execute_query(f'PRAGMA index_list("{table}")')
+    for row in rows:
+        _, columns = await connection.execute_query(
+            f'PRAGMA index_info("{row["name"]}")'
+        )
+        existing_indexes.add(tuple(column["name"] for column in columns))
+
+    _, rows = await connection.execute_query(
+        "SELECT name FROM sqlite_master WHERE type = 'index'"
+    )
+    taken_names = {row["name"] for row in rows}
+    for columns in _hot_query_indexes(model):
+        if columns in existing_indexes:
+            continue
+
+        base_name = f"idx_{model._meta.db_table}_{'_'.join(columns)}"
+        index_name = base_name
+        suffix = 1
+        while index_name in taken_names:
+            index_name = f"{base_name}_{suffix}"
+            suffix += 1
+
+        column_list = ", ".join(f'"{column}"' for column in columns)
+        await connection.execute_script(
+            f'CREATE INDEX "{index_name}" ON "{table}" ({column_list})'
+        )
+        taken_names.add(index_name)
+
+
+# Track fields indexed for full-text search
+SEARCH_FIELDS = ("title", "artist", "album", "album_artist")
+
+
+async def create_search_index(model: type[Model]) -> None:
+    """Create an FTS5 index over the SEARCH_FIELDS of MODEL if it's missing.
+
+    The index is an external content table kept in sync by triggers, so every
+    write to the model's table is indexed.
+    """
+    connection = Tortoise.get_connection("default")
+    table = model._meta.db_table
+    search_table = f"{table}_search"
+    _, rows = await connection.execute_query(
+        "SELECT count(*) FROM sqlite_master WHERE name = ?", [search_table]
+    )
+    if rows[0][0]:
+        return
+
+    logger.debug(f"Creating search index {search_table}")
+    columns = ", ".join(f'"{field}"' for field in SEARCH_FIELDS)
+    new_values = ", ".join(f'new."{field}"' for field in SEARCH_FIELDS)
+    old_values = ", ".join(f'old."{field}"' for field in SEARCH_FIELDS)
+    delete_old = (
+        f'INSERT INTO "{search_table}" ("{search_table}", rowid, {columns}) '
+        f"VALUES ('delete', old.\"id\", {old_values});"
+    )
+    insert_new = (
+        f'INSERT INTO "{search_table}" (rowid, {columns}) '
+        f'VALUES (new."id", {new_values});'
+    )
+    await connection.execute_script(
+        f'CREATE VIRTUAL TABLE "{search_table}" USING fts5({columns}, '
+        f"content='{table}', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2'); "
+        f'CREATE TRIGGER "{search_table}_insert" AFTER INSERT ON "{table}" '
+        f"BEGIN {insert_new} END; "
+        f'CREATE TRIGGER "{search_table}_delete" AFTER DELETE ON "{table}" '
+        f"BEGIN {delete_old} END; "
+        f'CREATE TRIGGER "{search_table}_update" AFTER UPDATE ON "{table}" '
+        f"BEGIN {delete_old} {insert_new} END; "
+        # Index rows written before the search index existed
+        f'INSERT INTO "{search_table}" ("{search_table}") VALUES (\'rebuild\')'
+    )
+
 
 class Database:
     def __str__(self) -> str:
@@ -14,10 +174,64 @@ class Database:
     async def start(self) -> None:
         logger.debug(f"Starting {self}")
         await Tortoise.init(
-            db_url=f"sqlite://{Config.database_file}",
-            modules={"models": ["djlib.models"]},
+            config={
+                "connections": {
+                    "default": {
+                        "engine": "tortoise.backends.sqlite",
+                        "credentials": {
+                            "file_path": Config.database_file,
+                            **Config.database_pragmas,
+                        },
+                    }
+                },
+                "apps": {"models": {"models": ["djlib.models"]}},
+            }
         )
+        await self._migrate()
         await Tortoise.generate_schemas()
+        await self._create_indexes()
+
+    async def _migrate(self) -> None:
+        connection = Tortoise.get_connection("default")
+        _, rows = await connection.execute_query("PRAGMA user_version")
+        version = rows[0][0]
+        _, rows = await connection.execute_query(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'table'"
+        )
+        if rows[0][0]:
+            for migration in MIGRATIONS[version:]:
+                if callable(migration):
+                    logger.debug(f"Migrating {self}: {migration.__name__}")
+                    await migration(connection)
+                else:
+                    logger.debug(f"Migrating {self}: {migration}")
+                    await connection.execute_script(migration)
+
+        # New databases are created from the current models
+        await connection.execute_script(f"PRAGMA user_version = {len(MIGRATIONS)}")
+
+    async def _create_indexes(self) -> None:
+        from .models import Track
+
+        for model in Tortoise.apps["models"].values():
+            await create_indexes(model)
+            if issubclass(model, Track):
+                await create_search_index(model)
+
+    @staticmethod
+    async def explain(
+        query: Union[QuerySet, str], values: Optional[list] = None
+    ) -> List[str]:
+        """Return the EXPLAIN QUERY PLAN lines for QUERY.
+
+        QUERY is a QuerySet, or a raw SQL statement with its parameters in VALUES.
+        """
+        if isinstance(query, QuerySet):
+            query = query.sql(params_inline=True)
+
+        connection = Tortoise.get_connection("default")
+        _, rows = await connection.execute_query(f"EXPLAIN QUERY PLAN {query}", values)
+        return [row["detail"] for row in rows]
 
     async def close(self) -> None:
         logger.debug(f"Closing {self}")
@@ -34,3 +248,208 @@ class Database:
         exc_tb: Optional[TracebackType],
     ):
         await self.close()
+
+
+class WriteQueue:
+    """Single writer task that groups queued ORM writes into shared transactions.
+
+    Each write runs in its own savepoint, so a failing write is rolled back and
+    raised to its caller without affecting the rest of its transaction.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = WRITE_BATCH_SIZE,
+        batch_delay: float = WRITE_BATCH_DELAY,
+    ):
+        self._batch_size = batch_size
+        self._batch_delay = batch_delay
+        self._writes: asyncio.Queue = asyncio.Queue()
+        self._writer: Optional[asyncio.Task] = None
+        # Set once the writer task stops taking writes
+        self._stopped = False
+
+    def __str__(self) -> str:
+        return f"<{self.__class__.__name__}>"
+
+    async def __aenter__(self) -> Self:
+        await self.start()
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_val: Optional[type[BaseException]],
+        exc_tb: Optional[TracebackType],
+    ):
+        await self.close()
+
+    async def start(self) -> None:
+        self._writer = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Wait for queued writes to commit, then stop the writer task."""
+        if not self._stopped:
+            await self._writes.put(None)
+
+        await asyncio.wait([self._writer])
+
+    async def write(
+        self, function: Callable[..., Awaitable[T]], *args: Any, **kwargs: Any
+    ) -> T:
+        """Queue FUNCTION(*ARGS, **KWARGS) and return its result once committed."""
+        if self._stopped:
+            raise self._stopped_error()
+
+        future = asyncio.get_running_loop().create_future()
+        await self._writes.put((function, args, kwargs, future))
+        return await future
+
+    def _stopped_error(self) -> RuntimeError:
+        return RuntimeError(f"{self} has stopped")
+
+    async def _run(self) -> None:
+        batch = []
+        try:
+            closing = False
+            while not closing:
+                batch = [await self._writes.get()]
+                deadline = time.monotonic() + self._batch_delay
+                while batch[-1] is not None and len(batch) < self._batch_size:
+                    try:
+                        batch.append(
+                            await asyncio.wait_for(
+                                self._writes.get(), deadline - time.monotonic()
+                            )
+                        )
+                    except TimeoutError:
+                        break
+
+                if batch[-1] is None:
+                    closing = True
+                    batch.pop()
+
+                if batch:
+                    await self._write_batch(batch)
+        finally:
+            # Fail writes that will never run, if the writer is dying
+            self._stopped = True
+            while not self._writes.empty():
+                batch.append(self._writes.get_nowait())
+
+            for write in batch:
+                if write is not None and not write[3].done():
+                    write[3].set_exception(self._stopped_error())
+
+    async def _write_batch(self, batch: list) -> None:
+        results = []
+        try:
+            async with transactions.in_transaction():
+                for function, args, kwargs, future in batch:
+                    try:
+                        async with transactions.in_transaction():
+                            result = await function(*args, **kwargs)
+                    except Exception as e:
+                        results.append((future, None, e))
+                    else:
+                        results.append((future, result, None))
+        except Exception as e:
+            # The commit failed, so none of the writes were saved
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        logger.debug(f"Committed {len(batch)} writes in {self}")
+        for future, result, exception in results:
+            if future.done():
+                continue
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+
+
+class ShadowTable:
+    """Copy of a model's table that is bulk-loaded and then swapped in.
+
+    Rows inserted during a refresh go to the shadow table, so readers keep seeing
+    the live table until swap replaces it in one short transaction. The shadow
+    table keeps the live table's UNIQUE constraints, and so their indexes, while
+    it's loaded, but the hot query indexes are only built before the swap.
+    """
+
+    def __init__(self, model: type[Model]):
+        self._model = model
+        self._table = model._meta.db_table
+        self.name = f"{self._table}_shadow"
+        self._columns = {
+            field_name: column
+            for field_name, column in model._meta.fields_db_projection.items()
+            if field_name != model._meta.pk_attr
+        }
+
+    def __str__(self) -> str:
+        return f"<{self.__class__.__name__}: {self.name}>"
+
+    async def create(self) -> None:
+        """Create the shadow table with the live table's columns and constraints."""
+        connection = Tortoise.get_connection("default")
+        _, rows = await connection.execute_query(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+            [self._table],
+        )
+        create_sql = rows[0]["sql"].replace(f'"{self._table}"', f'"{self.name}"', 1)
+        await connection.execute_script(
+            f'DROP TABLE IF EXISTS "{self.name}"; {create_sql}'
+        )
+
+    async def drop(self) -> None:
+        connection = Tortoise.get_connection("default")
+        await connection.execute_script(f'DROP TABLE IF EXISTS "{self.name}"')
+
+    async def insert(self, instances: List[Model]) -> None:
+        """Insert unsaved model INSTANCES into the shadow table."""
+        connection = Tortoise.get_connection("default")
+        fields_map = self._model._meta.fields_map
+        column_list = ", ".join(f'"{column}"' for column in self._columns.values())
+        placeholders = f"({', '.join('?' for _ in self._columns)})"
+        for batch in itertools.batched(
+            instances, SQLITE_MAX_VARIABLES // len(self._columns)
+        ):
+            await connection.execute_query(
+                f'INSERT INTO "{self.name}" ({column_list}) '
+                f"VALUES {', '.join(placeholders for _ in batch)}",
+                [
+                    fields_map[field_name].to_db_value(
+                        getattr(instance, field_name), instance
+                    )
+                    for instance in batch
+                    for field_name in self._columns
+                ],
+            )
+
+    async def swap(self, replaced_column: str, replaced_values: Collection) -> None:
+        """Replace the live table with the shadow table.
+
+        Live rows whose REPLACED_COLUMN isn't in REPLACED_VALUES are carried over
+        first. The hot query indexes are built before the swap transaction,
+        which then only drops the live table and renames the shadow table.
+        """
+        connection = Tortoise.get_connection("default")
+        column_list = ", ".join(f'"{column}"' for column in self._columns.values())
+        await connection.execute_query(
+            f'INSERT INTO "{self.name}" ({column_list}) '
+            f'SELECT {column_list} FROM "{self._table}" '
+            f'WHERE "{replaced_column}" NOT IN (SELECT value FROM json_each(?))',
+            [json.dumps(list(replaced_values))],
+        )
+        await create_indexes(self._model, self.name)
+
+        logger.debug(f"Swapping {self} in for {self._table}")
+        # Separate statements, since execute_script would commit each of them
+        async with transactions.in_transaction() as connection:
+            await connection.execute_query(f'DROP TABLE "{self._table}"')
+            await connection.execute_query(
+                f'ALTER TABLE "{self.name}" RENAME TO "{self._table}"'
+            )
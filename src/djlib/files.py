@@ -0,0 +1,97 @@
+import asyncio
+import errno
+import os
+from pathlib import Path
+
+from .logging import logger
+from .scheduler import Resource, scheduler
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+COPY_CHUNK_SIZE = 1_048_576
+
+# ioctl request to clone a file's extents (linux/fs.h)
+FICLONE = 0x40049409
+
+# Errors meaning a copy strategy isn't supported here, rather than a failed copy
+_UNSUPPORTED_ERRNOS = {
+    errno.EXDEV,
+    errno.EINVAL,
+    errno.ENOSYS,
+    errno.ENOTTY,
+    errno.EOPNOTSUPP,
+    errno.EPERM,
+    errno.EMLINK,
+}
+
+
+async def copy_file(source: Path, destination: Path) -> Path:
+    """Copy SOURCE to DESTINATION as cheaply as the filesystem allows.
+
+    Tries a copy-on-write reflink, then a hardlink when both paths are on the same
+    filesystem, then a chunked copy. A hardlinked DESTINATION shares its data with
+    SOURCE, so it should be renamed or replaced rather than modified in place.
+    """
+    async with scheduler.slot(Resource.FILE_IO):
+        return await asyncio.to_thread(_copy_file, source, destination)
+
+
+def _copy_file(source: Path, destination: Path) -> Path:
+    for strategy in (_reflink, _hardlink):
+        try:
+            strategy(source, destination)
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED_ERRNOS:
+                raise
+        else:
+            logger.debug(f"Copied {source} to {destination} with {strategy.__name__}")
+            return destination
+
+    _chunked_copy(source, destination)
+    logger.debug(f"Copied {source} to {destination} with {_chunked_copy.__name__}")
+    return destination
+
+
+def _reflink(source: Path, destination: Path) -> None:
+    if fcntl is None:
+        raise OSError(errno.ENOSYS, "Reflinks aren't supported on this platform")
+
+    with open(source, "rb") as source_file, open(destination, "wb") as dest_file:
+        try:
+            fcntl.ioctl(dest_file.fileno(), FICLONE, source_file.fileno())
+        except OSError:
+            dest_file.close()
+            destination.unlink()
+            raise
+
+
+def _hardlink(source: Path, destination: Path) -> None:
+    if source.stat().st_dev != destination.parent.stat().st_dev:
+        raise OSError(errno.EXDEV, "Not on the same filesystem", str(destination))
+
+    destination.hardlink_to(source)
+
+
+def _chunked_copy(source: Path, destination: Path) -> None:
+    with open(source, "rb") as source_file, open(destination, "wb") as dest_file:
+        if hasattr(os, "copy_file_range"):
+            # Copy inside the kernel when possible, which may also share extents
+            try:
+                while os.copy_file_range(
+                    source_file.fileno(), dest_file.fileno(), COPY_CHUNK_SIZE
+                ):
+                    pass
+                return
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED_ERRNOS:
+                    raise
+
+                dest_file.truncate(0)
+                source_file.seek(0)
+                dest_file.seek(0)
+
+        while chunk := source_file.read(COPY_CHUNK_SIZE):
+            dest_file.write(chunk)
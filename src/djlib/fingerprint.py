@@ -0,0 +1,189 @@
+"""Acoustic fingerprints for spotting the same recording under different tags.
+
+A fingerprint splits a track into FINGERPRINT_SEGMENTS segments and records, for
+each segment and pair of neighbouring frequency bands, whether the difference in
+their energy is above its median over the track. Fingerprints of the same
+recording differ in few bits, whatever its encoding, gain or tags, so they're
+compared by Hamming distance.
+
+Needs NumPy, installed with the "fingerprint" extra.
+"""
+
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+from mutagen import MutagenError
+from mutagen.id3 import ID3, TXXX
+from pydub import AudioSegment
+from pydub.exceptions import CouldntDecodeError
+
+from .logging import logger
+
+try:
+    import numpy as np
+except ImportError:  # Installed with the "fingerprint" extra
+    np = None
+
+# Rate audio is downsampled to before analysis
+SAMPLE_RATE = 5512  # Hz
+FRAME_SIZE = 2048
+FRAME_HOP = 1024
+
+# Frequency bands compared, spaced logarithmically
+BAND_COUNT = 33
+LOWEST_FREQUENCY = 300  # Hz
+HIGHEST_FREQUENCY = 2000  # Hz
+
+FINGERPRINT_SEGMENTS = 16
+FINGERPRINT_BITS = FINGERPRINT_SEGMENTS * (BAND_COUNT - 1)
+FINGERPRINT_WORDS = FINGERPRINT_BITS // 64
+
+# Most differing bits between fingerprints of the same recording. Unrelated
+# recordings differ in about half their bits.
+MATCH_DISTANCE = FINGERPRINT_BITS // 4
+
+# ID3 TXXX description of the tag exported tracks store their fingerprint in
+FINGERPRINT_TAG = "djlib_fingerprint"
+
+
+def available() -> bool:
+    return np is not None
+
+
+def fingerprint_samples(
+    samples: "np.ndarray", sample_rate: int, channels: int = 1
+) -> Optional[bytes]:
+    """Return the fingerprint of interleaved PCM SAMPLES, or None if too short."""
+    mono = np.asarray(samples, dtype=np.float32).reshape(-1, channels).mean(axis=1)
+
+    # Downsample by averaging blocks of samples, which also filters out the
+    # frequencies above the bands
+    factor = max(1, sample_rate // SAMPLE_RATE)
+    mono = mono[: len(mono) - len(mono) % factor].reshape(-1, factor).mean(axis=1)
+    rate = sample_rate / factor
+
+    if len(mono) < FRAME_SIZE + FRAME_HOP * FINGERPRINT_SEGMENTS:
+        return None
+
+    frames = np.lib.stride_tricks.sliding_window_view(mono, FRAME_SIZE)[::FRAME_HOP]
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(FRAME_SIZE), axis=1)) ** 2
+
+    # Sum the power in each band with one matrix product
+    frequencies = np.fft.rfftfreq(FRAME_SIZE, 1 / rate)
+    edges = np.geomspace(LOWEST_FREQUENCY, HIGHEST_FREQUENCY, BAND_COUNT + 1)
+    bands = np.digitize(frequencies, edges) - 1
+    in_band = (bands >= 0) & (bands < BAND_COUNT)
+    band_matrix = np.zeros((len(frequencies), BAND_COUNT), dtype=np.float32)
+    band_matrix[np.flatnonzero(in_band), bands[in_band]] = 1
+    energies = np.log1p(spectrum @ band_matrix)
+
+    segments = np.stack(
+        [
+            segment.mean(axis=0)
+            for segment in np.array_split(energies, FINGERPRINT_SEGMENTS)
+        ]
+    )
+    differences = segments[:, :-1] - segments[:, 1:]
+    bits = differences > np.median(differences, axis=0)
+    return np.packbits(bits).tobytes()
+
+
+def fingerprint_audio(audio: AudioSegment) -> Optional[bytes]:
+    """Return the fingerprint of decoded AUDIO."""
+    return fingerprint_samples(
+        np.array(audio.get_array_of_samples()), audio.frame_rate, audio.channels
+    )
+
+
+def fingerprint_file(path: Path) -> Optional[bytes]:
+    """Decode the audio file at PATH and return its fingerprint."""
+    try:
+        audio = AudioSegment.from_file(path)
+    except (CouldntDecodeError, OSError) as e:
+        logger.debug(f"Failed to fingerprint {path}: {e}")
+        return None
+
+    return fingerprint_audio(audio)
+
+
+def read_fingerprint_tag(path: Path) -> Optional[bytes]:
+    """Return the fingerprint stored in the ID3 tags of PATH, if any is valid."""
+    try:
+        frames = ID3(path).getall(f"TXXX:{FINGERPRINT_TAG}")
+    except MutagenError:
+        return None
+
+    if not frames or not frames[0].text:
+        return None
+
+    try:
+        fingerprint = bytes.fromhex(frames[0].text[0])
+    except ValueError:
+        fingerprint = None
+
+    if fingerprint is None or len(fingerprint) != FINGERPRINT_WORDS * 8:
+        logger.debug(f"Ignoring invalid fingerprint tag on {path}")
+        return None
+
+    return fingerprint
+
+
+def fingerprint_tag(fingerprint: bytes) -> TXXX:
+    return TXXX(desc=FINGERPRINT_TAG, text=fingerprint.hex())
+
+
+class FingerprintIndex:
+    """Fingerprints of tracks in growable arrays, searched by Hamming distance."""
+
+    def __init__(self, capacity: int = 1024):
+        self._ids = np.empty(capacity, dtype=np.int64)
+        self._fingerprints = np.empty((capacity, FINGERPRINT_WORDS), dtype=np.uint64)
+        self._rows = {}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, track_id: int) -> bool:
+        return track_id in self._rows
+
+    def add(self, track_id: int, fingerprint: bytes) -> None:
+        """Add or replace the fingerprint of the track with TRACK_ID."""
+        row = self._rows.get(track_id)
+        if row is None:
+            row = len(self._rows)
+            if row == len(self._ids):
+                self._grow()
+
+            self._rows[track_id] = row
+            self._ids[row] = track_id
+
+        self._fingerprints[row] = np.frombuffer(fingerprint, dtype=np.uint64)
+
+    def _grow(self) -> None:
+        capacity = max(1, len(self._ids) * 2)
+        self._ids = np.resize(self._ids, capacity)
+        self._fingerprints = np.resize(
+            self._fingerprints, (capacity, FINGERPRINT_WORDS)
+        )
+
+    def nearest(
+        self, fingerprint: bytes, among: Optional[Iterable[int]] = None
+    ) -> Optional[Tuple[int, int]]:
+        """Return the ID and distance of the track nearest to FINGERPRINT.
+
+        Only tracks with IDs in AMONG are considered, if it's given.
+        """
+        size = len(self._rows)
+        ids = self._ids[:size]
+        fingerprints = self._fingerprints[:size]
+        if among is not None:
+            mask = np.isin(ids, np.fromiter(among, dtype=np.int64))
+            ids, fingerprints = ids[mask], fingerprints[mask]
+
+        if not len(ids):
+            return None
+
+        query = np.frombuffer(fingerprint, dtype=np.uint64)
+        distances = np.bitwise_count(fingerprints ^ query).sum(axis=1)
+        row = int(np.argmin(distances))
+        return int(ids[row]), int(distances[row])
@@ -1,14 +1,86 @@
 import asyncio
+import json
+import sys
 from abc import ABC
 from pathlib import Path
 from types import TracebackType
-from typing import List, Optional, Self, Type, Union
-
+from typing import (
+    AsyncGenerator,
+    AsyncIterable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Self,
+    Type,
+    TypeVar,
+    Union,
+)
+
+from tortoise import Tortoise, transactions
 from tortoise.exceptions import IntegrityError
 
+from .. import matching
 from ..clients import Client, TrackExportError
+from ..database import SQLITE_MAX_VARIABLES, Database, ShadowTable, WriteQueue
 from ..logging import logger
-from ..models import Playlist, PlaylistStatus, Track
+from ..models import Playlist, PlaylistStatus, PlaylistTrack, Track, TrackMatch
+from ..models.abstract import PLAYLIST_TRACK_INDEX_GAP
+from ..scheduler import scheduler
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+T = TypeVar("T")
+
+# Tracks per chunk yielded by Library.tracks_not_in
+TRACKS_NOT_IN_CHUNK_SIZE = 500
+
+SEARCH_PAGE_SIZE = 20
+
+# Playlist tracks saved at a time during refresh
+REFRESH_CHUNK_SIZE = 500
+
+
+async def _chunked(
+    iterable: AsyncIterable[T], size: int
+) -> AsyncGenerator[List[T], None]:
+    chunk = []
+    async for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def _refresh_priority(
+    local_playlist: Optional[type[Playlist]], client_playlist: type[Playlist]
+) -> int:
+    """Return the scheduler priority for refreshing CLIENT_PLAYLIST.
+
+    Synced playlists go first, and within each group playlists modified since
+    the last refresh go before unchanged ones.
+    """
+    synced = local_playlist is not None and local_playlist.status == (
+        PlaylistStatus.SYNCED
+    )
+    modified = local_playlist is None or local_playlist.differs_from(client_playlist)
+    return (0 if synced else 2) + (0 if modified else 1)
+
+
+def _peak_memory() -> Optional[int]:
+    """Return the peak resident memory of this process in bytes, if known."""
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
 
 
 class Library(ABC):
@@ -36,6 +108,10 @@ class Library(ABC):
 
         self._client = self.client_class()
 
+    @property
+    def _playlist_track_model(self) -> Type[PlaylistTrack]:
+        return self.playlists._meta.fields_map["playlist_tracks"].related_model
+
     def __str__(self) -> str:
         return f"<{self.__class__.__name__}>"
 
@@ -63,31 +139,87 @@ class Library(ABC):
         """Refresh local models with external data from client."""
         logger.info(f"Refreshing {self}")
 
-        # Cache updated tracks to avoid calling create/update
-        # multiple times on the same track
-        self._tracks_external_id_map = {}
+        # IDs of saved tracks by interned external ID, so each track is only
+        # written once and no model instances outlive their playlist's refresh
+        self._track_ids = {}
+        # Futures for tracks being saved with another playlist
+        self._track_saves = {}
 
-        client_playlists = []
-        async with asyncio.TaskGroup() as tg:
-            async for client_playlist in self._client.get_playlists():
-                client_playlists.append(client_playlist)
-                tg.create_task(self._refresh_playlist(client_playlist))
-
-        # Delete local playlists that no longer exist on client
-        await self.playlists.exclude(
-            external_id__in=(
-                client_playlist.external_id for client_playlist in client_playlists
-            )
-        ).delete()
+        # Refreshed playlist tracks are loaded into a shadow table, which is
+        # swapped in once every playlist is done
+        self._playlist_tracks_shadow = ShadowTable(self._playlist_track_model)
+        self._refreshed_playlists = []
+        await self._playlist_tracks_shadow.create()
 
-        await self._refresh_non_playlist_tracks()
+        try:
+            async with scheduler.reporting():
+                await self._refresh()
+        finally:
+            self._track_ids = {}
+            self._track_saves = {}
+            self._refreshed_playlists = []
+
+        peak_memory = _peak_memory()
+        if peak_memory is None:
+            logger.info(f"Finished refreshing {self}")
+        else:
+            logger.info(
+                f"Finished refreshing {self} (peak memory: "
+                f"{peak_memory / 1_048_576:,.1f} MiB)"
+            )
 
-        logger.info(f"Finished refreshing {self}")
+    async def _refresh(self) -> None:
+        local_playlists = {
+            playlist.external_id: playlist for playlist in await self.playlists.all()
+        }
+        async with self._client.snapshot():
+            # Group the many small writes made by concurrent playlist refreshes
+            # into shared transactions
+            async with WriteQueue() as self._write_queue:
+                client_playlists = []
+                async with asyncio.TaskGroup() as tg:
+                    async for client_playlist in self._client.get_playlists():
+                        client_playlists.append(client_playlist)
+                        tg.create_task(
+                            scheduler.run(
+                                self._refresh_playlist,
+                                client_playlist,
+                                priority=_refresh_priority(
+                                    local_playlists.get(client_playlist.external_id),
+                                    client_playlist,
+                                ),
+                            )
+                        )
+
+            # Delete local playlists that no longer exist on client
+            await self.playlists.exclude(
+                external_id__in=(
+                    client_playlist.external_id for client_playlist in client_playlists
+                )
+            ).delete()
+
+            if self._refreshed_playlists:
+                await self._playlist_tracks_shadow.swap(
+                    "playlist_id",
+                    {
+                        local_playlist.pk
+                        for local_playlist, _ in self._refreshed_playlists
+                    },
+                )
+                # Only mark playlists as up to date once their tracks are live
+                async with transactions.in_transaction():
+                    for local_playlist, client_playlist in self._refreshed_playlists:
+                        await local_playlist.update_to_match(client_playlist)
+            else:
+                await self._playlist_tracks_shadow.drop()
+
+            await self._refresh_non_playlist_tracks()
 
     async def _refresh_playlist(self, client_playlist: type[Playlist]) -> None:
         logger.debug(f"Refreshing {client_playlist}")
         try:
-            local_playlist, created = await self.playlists.update_or_create(
+            local_playlist, created = await self._write_queue.write(
+                self.playlists.update_or_create,
                 external_id=client_playlist.external_id,
                 defaults={"name": client_playlist.name},
             )
@@ -96,22 +228,77 @@ class Library(ABC):
         else:
             if local_playlist.differs_from(client_playlist):
                 await self._refresh_playlist_tracks(local_playlist)
-                await local_playlist.update_to_match(client_playlist)
+                self._refreshed_playlists.append((local_playlist, client_playlist))
 
             logger.debug(f"Finished refreshing {client_playlist}")
 
     async def _refresh_playlist_tracks(self, playlist: type[Playlist]) -> None:
-        tracks = []
+        # Save each chunk while the next is read from the client
+        position = 0
+        saving = None
         async with asyncio.TaskGroup() as tg:
-            async for track in self._client.get_playlist_tracks(playlist):
-                try:
-                    tracks.append(self._tracks_external_id_map[track.external_id])
-                except KeyError:
-                    tg.create_task(track.set_id_and_save())
-                    self._tracks_external_id_map[track.external_id] = track
-                    tracks.append(track)
+            async for tracks in _chunked(
+                self._client.get_playlist_tracks(playlist), REFRESH_CHUNK_SIZE
+            ):
+                if saving is not None:
+                    await saving
+
+                saving = tg.create_task(
+                    self._save_playlist_tracks(playlist, tracks, position)
+                )
+                position += len(tracks)
+
+    async def _save_playlist_tracks(
+        self, playlist: type[Playlist], tracks: List[type[Track]], position: int
+    ) -> None:
+        """Save TRACKS and add them to PLAYLIST's shadow rows from POSITION on."""
+        external_ids = []
+        new_tracks = []
+        saved = asyncio.get_running_loop().create_future()
+        for track in tracks:
+            external_id = sys.intern(track.external_id)
+            external_ids.append(external_id)
+            if external_id in self._track_ids or external_id in self._track_saves:
+                continue
+
+            # Tracks loaded from the cache are already saved
+            if track.pk is None:
+                new_tracks.append(track)
+                self._track_saves[external_id] = saved
+            else:
+                self._track_ids[external_id] = track.pk
 
-        await playlist.add_tracks(*tracks, delete_existing=True)
+        try:
+            await self._write_queue.write(self.tracks.bulk_upsert, new_tracks)
+        except BaseException:
+            saved.cancel()
+            raise
+
+        for track in new_tracks:
+            external_id = sys.intern(track.external_id)
+            self._track_ids[external_id] = track.pk
+            del self._track_saves[external_id]
+        saved.set_result(None)
+
+        # Wait for tracks shared with playlists that are still being saved
+        await asyncio.gather(
+            *{
+                self._track_saves[external_id]
+                for external_id in external_ids
+                if external_id not in self._track_ids
+            }
+        )
+        await self._write_queue.write(
+            self._playlist_tracks_shadow.insert,
+            [
+                self._playlist_track_model(
+                    playlist_id=playlist.pk,
+                    track_id=self._track_ids[external_id],
+                    index=(position + i + 1) * PLAYLIST_TRACK_INDEX_GAP,
+                )
+                for i, external_id in enumerate(external_ids)
+            ],
+        )
 
     async def _refresh_non_playlist_tracks(self) -> None:
         pass
@@ -130,62 +317,322 @@ class Library(ABC):
         await track.save()
         logger.debug(f"Imported {track}")
 
-    async def update_playlist_to_match_source(
-        self, source_playlist: type[Playlist]
-    ) -> None:
-        playlist, created = await self.playlists.update_or_create(
-            name=source_playlist.name, defaults={"status": PlaylistStatus.SYNCED}
-        )
-
-        if created:
-            logger.debug(f"Created {playlist}")
+    async def import_tracks(self, *track_paths: Path) -> List[type[Track]]:
+        """Import tracks at TRACK_PATHS to external library in a single batch.
 
-        # Get all source track ISRCs at once
-        source_isrcs = await source_playlist.tracks.exclude(isrc=None).values_list(
-            "isrc", flat=True
+        Returns the tracks imported, leaving out those the client failed to import.
+        """
+        async with asyncio.TaskGroup() as tg:
+            from_file_tasks = [
+                tg.create_task(asyncio.to_thread(self.tracks.from_file, track_path))
+                for track_path in track_paths
+            ]
+
+        tracks = [task.result() for task in from_file_tasks]
+        imported_tracks = await self._client.import_tracks(tracks)
+        # The client has already committed the tracks, so rows left in the cache
+        # under the same external IDs are updated rather than clashed with
+        await self.tracks.bulk_upsert(imported_tracks)
+        logger.debug(
+            f"Imported {len(imported_tracks):,}/{len(tracks):,} tracks to {self}"
         )
-        source_isrcs = list(source_isrcs)  # Convert to list for comparison
-
-        # Get current playlist track ISRCs
-        current_isrcs = await playlist.tracks.exclude(isrc=None).values_list(
-            "isrc", flat=True
+        return imported_tracks
+
+    async def update_playlists_to_match_source(self, source: type[Self]) -> None:
+        """Update playlists to match the synced playlists in SOURCE.
+
+        The tracks of every synced playlist are compared by packed ISRC, or by
+        fuzzy match for tracks without one, in one pass, and only the playlists
+        that differ are rewritten.
+        """
+        source_playlists = await source.playlists.filter(status=PlaylistStatus.SYNCED)
+        if not source_playlists:
+            return
+
+        names = [playlist.name for playlist in source_playlists]
+        playlists_by_name = {}
+        for i in range(0, len(names), SQLITE_MAX_VARIABLES):
+            async for playlist in self.playlists.filter(
+                name__in=names[i : i + SQLITE_MAX_VARIABLES]
+            ):
+                playlists_by_name[playlist.name] = playlist
+
+        # Existing playlists are synced too, whether or not their tracks differ
+        playlist_ids = [playlist.id for playlist in playlists_by_name.values()]
+        for i in range(0, len(playlist_ids), SQLITE_MAX_VARIABLES):
+            await self.playlists.filter(
+                id__in=playlist_ids[i : i + SQLITE_MAX_VARIABLES]
+            ).update(status=PlaylistStatus.SYNCED)
+
+        for playlist in playlists_by_name.values():
+            playlist.status = PlaylistStatus.SYNCED
+
+        source_keys = await source._match_keys_by_playlist(
+            source_playlists, target=self
         )
-        current_isrcs = list(current_isrcs)  # Convert to list for comparison
+        current_keys = await self._match_keys_by_playlist(playlists_by_name.values())
+
+        # Only update playlists whose tracks differ (by ISRC and order)
+        updates = []
+        for source_playlist in source_playlists:
+            playlist = playlists_by_name.get(source_playlist.name)
+            keys = source_keys[source_playlist.id]
+            if playlist is not None and current_keys[playlist.id] == keys:
+                logger.debug(
+                    f"No update needed for {playlist} - tracks match {source_playlist}"
+                )
+            else:
+                updates.append((source_playlist, playlist, keys))
+
+        if not updates:
+            return
+
+        # Look up the tracks of every playlist being updated at once
+        tracks_by_key = {}
+        unique_keys = list({key for _, _, keys in updates for key in keys})
+        for i in range(0, len(unique_keys), SQLITE_MAX_VARIABLES):
+            batch = unique_keys[i : i + SQLITE_MAX_VARIABLES]
+            isrc_keys = [key for key in batch if key > 0]
+            async for track in self.tracks.filter(isrc_key__in=isrc_keys):
+                tracks_by_key[track.isrc_key] = track
+
+            ids = [-key for key in batch if key < 0]
+            async for track in self.tracks.filter(id__in=ids):
+                tracks_by_key[-track.id] = track
 
-        # Only update if the tracks differ (by ISRC and order)
-        if current_isrcs != source_isrcs:
-            logger.debug(
-                f"Updating {playlist} to match {source_playlist} - tracks differ"
+        async with asyncio.TaskGroup() as tg:
+            for source_playlist, playlist, keys in updates:
+                tg.create_task(
+                    self._update_playlist_to_match_source(
+                        source_playlist, playlist, keys, tracks_by_key
+                    )
+                )
+
+    async def _update_playlist_to_match_source(
+        self,
+        source_playlist: type[Playlist],
+        playlist: Optional[type[Playlist]],
+        keys: List[int],
+        tracks_by_key: Dict[int, type[Track]],
+    ) -> None:
+        if playlist is None:
+            playlist, created = await self.playlists.update_or_create(
+                name=source_playlist.name, defaults={"status": PlaylistStatus.SYNCED}
             )
+            if created:
+                logger.debug(f"Created {playlist}")
 
-            # Find all matching tracks in a single query
-            matching_tracks = await self.tracks.filter(isrc__in=source_isrcs)
+            if not keys:
+                return
 
-            # Create a lookup map for faster access
-            tracks_by_isrc = {track.isrc: track for track in matching_tracks}
+        logger.debug(f"Updating {playlist} to match {source_playlist} - tracks differ")
 
-            # Build the final tracks list in the same order as source tracks
-            tracks = []
-            for isrc in source_isrcs:
-                if track := tracks_by_isrc.get(isrc):
-                    tracks.append(track)
-                else:
-                    logger.debug(f"Missing track for {playlist} with ISRC: {isrc}")
+        # Build the final tracks list in the same order as source tracks
+        tracks = []
+        for key in keys:
+            if track := tracks_by_key.get(key):
+                tracks.append(track)
+            else:
+                logger.debug(f"Missing track for {playlist} with match key: {key}")
+
+        await playlist.add_tracks(*tracks, delete_existing=True)
+        await self._client.update_playlist(playlist)
 
-            await playlist.add_tracks(*tracks, delete_existing=True)
-            await self._client.update_playlist(playlist)
+    async def _match_keys_by_playlist(
+        self,
+        playlists: Iterable[type[Playlist]],
+        target: Optional[type[Self]] = None,
+    ) -> Dict[int, List[int]]:
+        """Return the match keys of the tracks in PLAYLISTS in order, by playlist ID.
+
+        A track's match key is the packed ISRC of the track it matches in TARGET,
+        or of itself when TARGET isn't given, falling back to the negated ID of a
+        fuzzy matched target track without an ISRC. Tracks with neither are left
+        out.
+        """
+        keys = {playlist.id: [] for playlist in playlists}
+        if not keys:
+            return keys
+
+        connection = Tortoise.get_connection("default")
+        _, rows = await connection.execute_query(
+            self._match_keys_sql(target), [json.dumps(list(keys))]
+        )
+        for row in rows:
+            keys[row["playlist_id"]].append(row["key"])
+
+        return keys
+
+    def _match_keys_sql(self, target: Optional[type[Self]] = None) -> str:
+        """Return SQL selecting match keys by playlist, for _match_keys_by_playlist.
+
+        Its one parameter is the playlist IDs as a JSON list.
+        """
+        match_table = TrackMatch._meta.db_table
+        column = TrackMatch.track_column(self.tracks)
+        if target is None:
+            key = (
+                'CASE WHEN "track"."isrc_key" IS NOT NULL THEN "track"."isrc_key" '
+                f'WHEN EXISTS (SELECT 1 FROM "{match_table}" AS "match" '
+                f'WHERE "match"."{column}" = "track"."id") THEN -"track"."id" END'
+            )
         else:
-            logger.debug(
-                f"No update needed for {playlist} - tracks match {source_playlist}"
+            target_column = TrackMatch.track_column(target.tracks)
+            key = (
+                'COALESCE((SELECT COALESCE("target"."isrc_key", -"target"."id") '
+                f'FROM "{match_table}" AS "match" '
+                f'JOIN "{target.tracks._meta.db_table}" AS "target" '
+                f'ON "target"."id" = "match"."{target_column}" '
+                f'WHERE "match"."{column}" = "track"."id"), "track"."isrc_key")'
+            )
+
+        return (
+            f'SELECT "playlist_track"."playlist_id", {key} AS "key" '
+            f'FROM "{self._playlist_track_model._meta.db_table}" AS "playlist_track" '
+            f'JOIN "{self.tracks._meta.db_table}" AS "track" '
+            'ON "track"."id" = "playlist_track"."track_id" '
+            'WHERE "playlist_track"."playlist_id" IN '
+            "(SELECT value FROM json_each(?)) "
+            'AND "key" IS NOT NULL '
+            'ORDER BY "playlist_track"."playlist_id", "playlist_track"."index"'
+        )
+
+    async def explain(self, target: type[Self]) -> Dict[str, List[str]]:
+        """Return the query plans of the queries used to refresh this library and
+        update TARGET from it, by query name."""
+        # Raw statements are paired with their parameters
+        queries = {
+            "playlist tracks": self._playlist_track_model.filter(playlist_id=0),
+            "tracks by ISRC": self.tracks.filter(isrc_key__in=[0]),
+            "tracks by ID": self.tracks.filter(id__in=[0]),
+            "tracks with no playlist": self.tracks.filter(playlist_tracks=None),
+            f"tracks not in {target}": (
+                self._tracks_not_in_sql(target, 0, TRACKS_NOT_IN_CHUNK_SIZE),
+                None,
+            ),
+            "match keys": (self._match_keys_sql(), ["[0]"]),
+            f"match keys in {target}": (self._match_keys_sql(target), ["[0]"]),
+        }
+        plans = {}
+        for name, query in queries.items():
+            if isinstance(query, tuple):
+                plans[name] = await Database.explain(*query)
+            else:
+                plans[name] = await Database.explain(query)
+
+        return plans
+
+    async def search(
+        self, query: str, page: int = 1, page_size: int = SEARCH_PAGE_SIZE
+    ) -> List[type[Track]]:
+        """Return a page of tracks matching QUERY, best matches first.
+
+        Every word in QUERY must prefix a word in the title, artist, album or album
+        artist.
+        """
+        words = query.split()
+        if not words:
+            return []
+
+        search_table = f"{self.tracks._meta.db_table}_search"
+        match = " ".join('"{}"*'.format(word.replace('"', '""')) for word in words)
+        connection = Tortoise.get_connection("default")
+        _, rows = await connection.execute_query(
+            f'SELECT rowid FROM "{search_table}" WHERE "{search_table}" MATCH ? '
+            f'ORDER BY bm25("{search_table}") LIMIT ? OFFSET ?',
+            [match, page_size, (page - 1) * page_size],
+        )
+        track_ids = [row[0] for row in rows]
+        tracks = {
+            track.id: track for track in await self.tracks.filter(id__in=track_ids)
+        }
+        return [tracks[track_id] for track_id in track_ids]
+
+    async def tracks_not_in(
+        self, target: type[Self], chunk_size: int = TRACKS_NOT_IN_CHUNK_SIZE
+    ) -> AsyncGenerator[List[type[Track]], None]:
+        """Yield chunks of tracks from synced playlists not found in TARGET.
+
+        Tracks are matched on packed ISRC with an anti-join inside the database,
+        or by a saved fuzzy match, and paged through by ID. Tracks without an ISRC
+        are left out, since they can't be exported.
+        """
+        last_id = 0
+        while True:
+            tracks = await self.tracks.raw(
+                self._tracks_not_in_sql(target, last_id, chunk_size)
             )
+            if not tracks:
+                return
+
+            yield tracks
+            last_id = tracks[-1].id
+
+    def _tracks_not_in_sql(
+        self, target: type[Self], last_id: int, chunk_size: int
+    ) -> str:
+        """Return SQL selecting a chunk of tracks not in TARGET after LAST_ID."""
+        return (
+            f'SELECT * FROM "{self.tracks._meta.db_table}" AS "source" '
+            f'WHERE "source"."id" > {int(last_id)} '
+            'AND "source"."isrc_key" IS NOT NULL '
+            f"AND {self._synced_and_unmatched_in(target)} "
+            f'ORDER BY "source"."id" LIMIT {int(chunk_size)}'
+        )
 
-    async def tracks_not_in(self, target: type[Self]) -> List[type[Track]]:
-        """Return a QuerySet of tracks from synced playlists not found in OTHER."""
-        target_isrcs = (
-            await target.tracks.all().exclude(isrc=None).values_list("isrc", flat=True)
+    async def match_tracks(self, target: type[Self]) -> int:
+        """Fuzzy match tracks from synced playlists that TARGET has no ISRC match for.
+
+        Tracks are matched on artist, title and duration, and the matches are saved
+        as TrackMatch rows. Returns the number of new matches.
+        """
+        tracks = await self.tracks.raw(
+            f'SELECT * FROM "{self.tracks._meta.db_table}" AS "source" '
+            f"WHERE {self._synced_and_unmatched_in(target)}"
+        )
+        if not tracks:
+            return 0
+
+        target_column = TrackMatch.track_column(target.tracks)
+        target_tracks = await target.tracks.raw(
+            f'SELECT * FROM "{target.tracks._meta.db_table}" AS "target" '
+            f'WHERE NOT EXISTS (SELECT 1 FROM "{TrackMatch._meta.db_table}" AS "match" '
+            f'WHERE "match"."{target_column}" = "target"."id")'
         )
+        logger.debug(
+            f"Matching {len(tracks):,} tracks in {self} against "
+            f"{len(target_tracks):,} tracks in {target}"
+        )
+        matches = await asyncio.to_thread(matching.match_tracks, tracks, target_tracks)
+
+        column = TrackMatch.track_column(self.tracks)
+        await TrackMatch.bulk_create(
+            [
+                TrackMatch(
+                    **{column: track.id, target_column: target_track.id}, score=score
+                )
+                for track, target_track, score in matches
+            ],
+            batch_size=SQLITE_MAX_VARIABLES // 3,
+        )
+        logger.debug(f"Matched {len(matches):,} tracks in {self} to {target}")
+        return len(matches)
+
+    def _synced_and_unmatched_in(self, target: type[Self]) -> str:
+        """Return SQL selecting "source" tracks in synced playlists not in TARGET."""
+        column = TrackMatch.track_column(self.tracks)
         return (
-            await self.tracks.in_synced_playlists()
-            .exclude(isrc=None)
-            .exclude(isrc__in=target_isrcs)
+            "EXISTS ("
+            f'SELECT 1 FROM "{self._playlist_track_model._meta.db_table}" '
+            'AS "playlist_track" '
+            f'JOIN "{self.playlists._meta.db_table}" AS "playlist" '
+            'ON "playlist"."id" = "playlist_track"."playlist_id" '
+            'WHERE "playlist_track"."track_id" = "source"."id" '
+            f'AND "playlist"."status" = \'{PlaylistStatus.SYNCED.value}\') '
+            "AND NOT EXISTS ("
+            f'SELECT 1 FROM "{target.tracks._meta.db_table}" AS "target" '
+            'WHERE "target"."isrc_key" = "source"."isrc_key") '
+            "AND NOT EXISTS ("
+            f'SELECT 1 FROM "{TrackMatch._meta.db_table}" AS "match" '
+            f'WHERE "match"."{column}" = "source"."id")'
         )
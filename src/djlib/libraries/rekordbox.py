@@ -1,25 +1,219 @@
 import asyncio
+import itertools
+from pathlib import Path
+from typing import List, Optional
 
+from mutagen import MutagenError
+from mutagen.id3 import ID3
+
+from .. import fingerprint
 from ..clients import RekordboxClient
-from ..models import RekordboxPlaylist, RekordboxTrack
+from ..database import SQLITE_MAX_VARIABLES
+from ..logging import logger
+from ..matching import DURATION_TOLERANCE
+from ..models import (
+    RekordboxPlaylist,
+    RekordboxSyncState,
+    RekordboxTrack,
+    SpotifyTrack,
+    TrackMatch,
+)
+from ..scheduler import Resource, scheduler
 from .abstract import Library
 
+# Rows written per bulk statement, keeping within SQLite's variable limit
+BULK_BATCH_SIZE = 50
+
+# Fields refreshed on cached tracks whose rekordbox row has changed
+UPDATE_FIELDS = (
+    "title",
+    "artist",
+    "album",
+    "album_artist",
+    "track_number",
+    "disc_number",
+    "isrc",
+    "isrc_key",
+    "duration",
+    "path",
+    "rb_local_usn",
+    "audio_fingerprint",
+)
+
 
 class RekordboxLibrary(Library):
     client_class = RekordboxClient
     playlists = RekordboxPlaylist
     tracks = RekordboxTrack
 
+    # Local USN of the last successful refresh, or None for a full refresh
+    _since_usn: Optional[int] = None
+
+    async def refresh(self) -> None:
+        local_usn, database_fingerprint = await self._client.get_database_state()
+        sync_state = await RekordboxSyncState.first()
+        if sync_state is not None and (
+            sync_state.local_usn == local_usn
+            and sync_state.database_fingerprint == database_fingerprint
+        ):
+            logger.info(f"{self} is unchanged since the last refresh, skipping")
+            return
+
+        self._since_usn = sync_state.local_usn if sync_state is not None else None
+        await super().refresh()
+
+        if sync_state is None:
+            sync_state = RekordboxSyncState()
+
+        sync_state.local_usn = local_usn
+        sync_state.database_fingerprint = database_fingerprint
+        await sync_state.save()
+
     async def _refresh_non_playlist_tracks(self) -> None:
-        # Delete cached tracks with no playlists
-        track_ids = (
-            await RekordboxTrack.filter(playlist_tracks=None)
-            .all()
-            .values_list("id", flat=True)
+        # Diff tracks with no playlist against the cache by external ID, so
+        # unchanged rows (and their IDs) survive the refresh
+        client_tracks = [
+            track
+            async for track in self._client.get_non_playlist_tracks(
+                since_usn=self._since_usn
+            )
+        ]
+        if self._since_usn is None:
+            client_track_ids = {track.external_id for track in client_tracks}
+        else:
+            client_track_ids = await self._client.get_non_playlist_track_ids()
+
+        # Delete cached tracks that are no longer loose tracks on rekordbox
+        track_ids = [
+            track_id
+            for track_id, external_id in await RekordboxTrack.filter(
+                playlist_tracks=None
+            ).values_list("id", "external_id")
+            if external_id not in client_track_ids
+        ]
+        for batch in itertools.batched(track_ids, SQLITE_MAX_VARIABLES):
+            await RekordboxTrack.filter(id__in=batch).delete()
+
+        # Tracks loaded from the cache are already saved
+        changed_tracks = [track for track in client_tracks if track.pk is None]
+        existing_ids = {}
+        for batch in itertools.batched(
+            (track.external_id for track in changed_tracks), SQLITE_MAX_VARIABLES
+        ):
+            existing_ids.update(
+                await RekordboxTrack.filter(external_id__in=batch).values_list(
+                    "external_id", "id"
+                )
+            )
+
+        new_tracks = []
+        updated_tracks = []
+        for track in changed_tracks:
+            try:
+                track.id = existing_ids[track.external_id]
+            except KeyError:
+                new_tracks.append(track)
+            else:
+                updated_tracks.append(track)
+
+        logger.debug(
+            f"Refreshing tracks with no playlist in {self}: {len(new_tracks):,} new, "
+            f"{len(updated_tracks):,} updated, {len(track_ids):,} deleted"
+        )
+        await RekordboxTrack.bulk_create(new_tracks, batch_size=BULK_BATCH_SIZE)
+        if updated_tracks:
+            await RekordboxTrack.bulk_update(
+                updated_tracks,
+                fields=UPDATE_FIELDS,
+                batch_size=BULK_BATCH_SIZE,
+            )
+
+    async def import_tracks(self, *track_paths: Path) -> List[RekordboxTrack]:
+        """Import tracks at TRACK_PATHS, skipping recordings already in rekordbox.
+
+        Duplicates are found by acoustic fingerprint when NumPy is installed.
+        """
+        if fingerprint.available():
+            track_paths = await self._skip_duplicates(track_paths)
+
+        if not track_paths:
+            return []
+
+        return await super().import_tracks(*track_paths)
+
+    async def _skip_duplicates(self, track_paths: List[Path]) -> List[Path]:
+        unique_paths = []
+        for track_path in track_paths:
+            duplicate = await self._find_duplicate(track_path)
+            if duplicate is None:
+                unique_paths.append(track_path)
+
+        return unique_paths
+
+    async def _find_duplicate(self, track_path: Path) -> Optional[RekordboxTrack]:
+        track_fingerprint = await asyncio.to_thread(
+            fingerprint.read_fingerprint_tag, track_path
+        )
+        duration = await asyncio.to_thread(RekordboxTrack.read_duration, track_path)
+        if track_fingerprint is None or duration is None:
+            return None
+
+        # Only recordings of about the same length can be duplicates, so only
+        # those need fingerprinting
+        candidates = await RekordboxTrack.filter(
+            duration__gte=duration - DURATION_TOLERANCE,
+            duration__lte=duration + DURATION_TOLERANCE,
         )
-        await RekordboxTrack.filter(id__in=track_ids).all().delete()
+        if not candidates:
+            return None
+
+        async def _fingerprint(candidate: RekordboxTrack) -> None:
+            async with scheduler.slot(Resource.FILE_IO):
+                candidate.audio_fingerprint = await asyncio.to_thread(
+                    fingerprint.fingerprint_file, Path(candidate.path)
+                )
+
+            if candidate.audio_fingerprint is not None:
+                await candidate.save(update_fields=["audio_fingerprint"])
 
-        # Save updated list of tracks with no playlist
         async with asyncio.TaskGroup() as tg:
-            async for track in self._client.get_non_playlist_tracks():
-                tg.create_task(track.set_id_and_save())
+            for candidate in candidates:
+                if candidate.audio_fingerprint is None:
+                    tg.create_task(_fingerprint(candidate))
+
+        index = fingerprint.FingerprintIndex(capacity=len(candidates))
+        for candidate in candidates:
+            if candidate.audio_fingerprint is not None:
+                index.add(candidate.id, candidate.audio_fingerprint)
+
+        nearest = index.nearest(track_fingerprint)
+        if nearest is None or nearest[1] > fingerprint.MATCH_DISTANCE:
+            return None
+
+        track_id, distance = nearest
+        duplicate = next(c for c in candidates if c.id == track_id)
+        logger.info(f"Skipping import of {track_path}, it's a duplicate of {duplicate}")
+        await self._save_duplicate_match(track_path, duplicate, distance)
+        return duplicate
+
+    @staticmethod
+    async def _save_duplicate_match(
+        track_path: Path, duplicate: RekordboxTrack, distance: int
+    ) -> None:
+        # Exports from Spotify are tagged with their track ID, so the match can be
+        # saved and the track isn't exported again
+        try:
+            frames = ID3(track_path).getall("TXXX:spotify_uris")
+        except MutagenError:
+            return
+
+        if not frames:
+            return
+
+        spotify_track = await SpotifyTrack.get_or_none(external_id=frames[0].text[0])
+        if spotify_track is not None:
+            await TrackMatch.get_or_create(
+                spotify_track=spotify_track,
+                rekordbox_track=duplicate,
+                defaults={"score": 1 - distance / fingerprint.FINGERPRINT_BITS},
+            )
@@ -0,0 +1,179 @@
+"""Fuzzy matching of tracks across libraries by artist, title and duration.
+
+Used for tracks that can't be matched by ISRC. Target tracks are indexed by the
+words in their normalised titles, and each track is only scored against targets
+sharing one of its rarest title words, so matching stays close to linear in the
+size of the libraries.
+"""
+
+import re
+import unicodedata
+from collections import defaultdict
+from difflib import SequenceMatcher
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from .models import Track
+
+# Lowest score accepted as a match
+MATCH_THRESHOLD = 0.85
+
+# Largest difference in duration between matching tracks
+DURATION_TOLERANCE = 3000  # milliseconds
+
+# Title words whose blocks are searched for each track, rarest first
+BLOCKING_WORDS = 2
+
+# Weight of the title in a match score, the rest going to the artist
+TITLE_WEIGHT = 0.6
+
+# Words too common to narrow down candidates
+STOP_WORDS = {"a", "an", "and", "de", "el", "la", "le", "mix", "of", "the", "to"}
+
+_FEATURING = re.compile(r"[\(\[]?\b(?:feat|ft|featuring)\b\.?.*?(?:[\)\]]|$)")
+_ORIGINAL_MIX = re.compile(r"[\(\[\-]\s*original mix\s*[\)\]]?")
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize(text: Optional[str]) -> str:
+    """Return TEXT lowercased, without accents, featured artists or punctuation."""
+    if not text:
+        return ""
+
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold()
+    text = text.replace("&", " and ")
+    text = _FEATURING.sub(" ", text)
+    text = _ORIGINAL_MIX.sub(" ", text)
+    return " ".join(_NON_WORD.sub(" ", text).split())
+
+
+class _Entry(NamedTuple):
+    track: Track
+    title: str
+    artist: str
+    words: Set[str]
+
+
+def _entry(track: Track) -> _Entry:
+    title = normalize(track.title)
+    words = {word for word in title.split() if word not in STOP_WORDS}
+    return _Entry(track, title, normalize(track.artist), words or set(title.split()))
+
+
+def _similarity(a: str, b: str, minimum: float = 0.0) -> float:
+    """Return the similarity of A and B, or 0 if it can't reach MINIMUM."""
+    if a == b:
+        return 1.0
+
+    matcher = SequenceMatcher(None, a, b, autojunk=False)
+    if matcher.real_quick_ratio() < minimum or matcher.quick_ratio() < minimum:
+        return 0.0
+
+    return matcher.ratio()
+
+
+def score(a: Track, b: Track) -> float:
+    """Return how alike tracks A and B are, from 0 to 1."""
+    return _score(_entry(a), _entry(b))
+
+
+def _score(a: _Entry, b: _Entry, threshold: float = 0.0) -> float:
+    # Tracks with different ISRCs are different recordings, however alike
+    if a.track.isrc_key and b.track.isrc_key:
+        return 0.0
+
+    if (
+        a.track.duration
+        and b.track.duration
+        and abs(a.track.duration - b.track.duration) > DURATION_TOLERANCE
+    ):
+        return 0.0
+
+    if not a.artist or not b.artist:
+        return _similarity(a.title, b.title, threshold)
+
+    # Skip the full comparisons once THRESHOLD is out of reach
+    artist_weight = 1 - TITLE_WEIGHT
+    title_score = _similarity(
+        a.title, b.title, (threshold - artist_weight) / TITLE_WEIGHT
+    )
+    artist_score = _similarity(
+        a.artist, b.artist, (threshold - TITLE_WEIGHT * title_score) / artist_weight
+    )
+    return TITLE_WEIGHT * title_score + artist_weight * artist_score
+
+
+class TrackIndex:
+    """Blocking index over tracks, keyed by the words in their titles."""
+
+    def __init__(self, tracks: Iterable[Track]):
+        self._blocks: Dict[str, List[_Entry]] = defaultdict(list)
+        for entry in map(_entry, tracks):
+            for word in entry.words:
+                self._blocks[word].append(entry)
+
+    def candidates(self, track: Track) -> List[Track]:
+        """Return the indexed tracks sharing one of TRACK's rarest title words."""
+        return [entry.track for entry in self._candidates(_entry(track))]
+
+    def _candidates(self, entry: _Entry) -> List[_Entry]:
+        words = sorted(
+            (word for word in entry.words if word in self._blocks),
+            key=lambda word: len(self._blocks[word]),
+        )
+        seen = set()
+        candidates = []
+        for word in words[:BLOCKING_WORDS]:
+            for candidate in self._blocks[word]:
+                if id(candidate) not in seen:
+                    seen.add(id(candidate))
+                    candidates.append(candidate)
+
+        return candidates
+
+    def best_match(
+        self, track: Track, threshold: float = MATCH_THRESHOLD
+    ) -> Optional[Tuple[Track, float]]:
+        """Return the indexed track most like TRACK and its score, if any pass."""
+        matches = self._matches(_entry(track), threshold)
+        return max(matches, key=lambda match: match[1], default=None)
+
+    def _matches(self, entry: _Entry, threshold: float) -> List[Tuple[Track, float]]:
+        matches = []
+        for candidate in self._candidates(entry):
+            candidate_score = _score(entry, candidate, threshold)
+            if candidate_score >= threshold:
+                matches.append((candidate.track, candidate_score))
+
+        return matches
+
+
+def match_tracks(
+    tracks: Iterable[Track],
+    targets: Iterable[Track],
+    threshold: float = MATCH_THRESHOLD,
+) -> List[Tuple[Track, Track, float]]:
+    """Match TRACKS to TARGETS one to one, best scoring pairs first.
+
+    Returns (track, target, score) tuples for every pair scoring at least
+    THRESHOLD.
+    """
+    index = TrackIndex(targets)
+    pairs = []
+    for track in tracks:
+        for target, pair_score in index._matches(_entry(track), threshold):
+            pairs.append((track, target, pair_score))
+
+    pairs.sort(key=lambda pair: pair[2], reverse=True)
+    matched_tracks = set()
+    matched_targets = set()
+    matches = []
+    for track, target, pair_score in pairs:
+        if id(track) in matched_tracks or id(target) in matched_targets:
+            continue
+
+        matched_tracks.add(id(track))
+        matched_targets.add(id(target))
+        matches.append((track, target, pair_score))
+
+    return matches
@@ -3,10 +3,13 @@ from .abstract import (
     PlaylistStatus,
     PlaylistTrack,
     Track,
+    pack_isrc,
 )
+from .matching import TrackMatch
 from .rekordbox import (
     RekordboxPlaylist,
     RekordboxPlaylistTrack,
+    RekordboxSyncState,
     RekordboxTrack,
 )
 from .spotify import (
@@ -21,9 +24,12 @@ __all__ = [
     "PlaylistTrack",
     "RekordboxPlaylist",
     "RekordboxPlaylistTrack",
+    "RekordboxSyncState",
     "RekordboxTrack",
     "SpotifyPlaylist",
     "SpotifyPlaylistTrack",
     "SpotifyTrack",
     "Track",
+    "TrackMatch",
+    "pack_isrc",
 ]
@@ -1,13 +1,46 @@
+import itertools
 from enum import Enum
 from pathlib import Path
-from typing import List, Optional, Self
+from typing import Iterable, List, Optional, Self, Union
 
+import mutagen
+from mutagen import MutagenError
 from mutagen.id3 import ID3
 from tortoise import Tortoise, fields, transactions
+from tortoise.expressions import F
 from tortoise.models import Model
 from tortoise.queryset import QuerySet
 from tortoise.validators import MinLengthValidator, MinValueValidator
 
+from ..database import SQLITE_MAX_VARIABLES
+from ..logging import logger
+
+# Playlist tracks written per statement, keeping within SQLite's variable limit
+PLAYLIST_TRACK_BATCH_SIZE = 300
+
+# Spacing between the sort keys of consecutive playlist tracks, leaving room to
+# insert or move tracks without renumbering their neighbours
+PLAYLIST_TRACK_INDEX_GAP = 1024
+
+
+def pack_isrc(isrc: Optional[str]) -> Optional[int]:
+    """Pack ISRC into an integer, or return None if it isn't a valid ISRC.
+
+    The country and registrant codes are read as base 36, and the year and
+    designation code as decimal, so the result fits in a signed 64-bit integer.
+    """
+    if not isrc:
+        return None
+
+    isrc = str(isrc).replace("-", "").upper()
+    if len(isrc) != 12 or not isrc[:5].isalnum() or not isrc[5:].isdigit():
+        return None
+
+    try:
+        return int(isrc[:5], 36) * 10_000_000 + int(isrc[5:])
+    except ValueError:
+        return None
+
 
 class PlaylistStatus(str, Enum):
     NEW = "new"
@@ -47,37 +80,105 @@ class Playlist(Model):
     @transactions.atomic()
     async def add_tracks(
         self,
-        *tracks: List[type["Track"]],
+        *tracks: Union[type["Track"], int],
         index: Optional[int] = None,
         delete_existing=False,
     ) -> None:
         """Add TRACKS to this playlist, starting at INDEX.
 
+        TRACKS may be given as tracks or track IDs.
         If INDEX is None, TRACKS are added to the end of the playlist.
         If DELETE_EXISTING is True, existing playlist tracks are replaced with TRACKS.
         """
         if delete_existing:
             await self.playlist_tracks.all().delete()
-            playlist_tracks = []
+            count = 0
         else:
-            playlist_tracks = list(await self.playlist_tracks.all())
+            count = await self.playlist_tracks.all().count()
+
+        # Clamp INDEX like a list insert would
+        index = count if index is None else slice(index, index).indices(count)[0]
+        sort_keys = await self._free_sort_keys(index, len(tracks))
+        await self._playlist_track_model.bulk_create(
+            [
+                self._playlist_track_model(
+                    playlist=self,
+                    track_id=track if isinstance(track, int) else track.pk,
+                    index=sort_key,
+                )
+                for track, sort_key in zip(tracks, sort_keys)
+            ],
+            batch_size=PLAYLIST_TRACK_BATCH_SIZE,
+        )
+
+    @transactions.atomic()
+    async def move_track(self, from_index: int, to_index: int) -> None:
+        """Move the track at FROM_INDEX in this playlist to TO_INDEX."""
+        playlist_track = (
+            await self.playlist_tracks.all()
+            .order_by("index")
+            .offset(from_index)
+            .first()
+        )
+        if playlist_track is None:
+            raise IndexError(f"No track at index {from_index} in {self}")
+
+        # Clamp TO_INDEX like a list insert would, once the track is removed
+        count = await self.playlist_tracks.all().count() - 1
+        to_index = slice(to_index, to_index).indices(count)[0]
+        (sort_key,) = await self._free_sort_keys(
+            to_index, 1, exclude_id=playlist_track.id
+        )
+        playlist_track.index = sort_key
+        await playlist_track.save(update_fields=["index"])
 
-        if index is None:
-            index = len(playlist_tracks)
+    async def _free_sort_keys(
+        self, index: int, count: int, exclude_id: Optional[int] = None
+    ) -> List[int]:
+        """Return COUNT unused sort keys for tracks inserted at INDEX.
+
+        Keys are taken from the gap between the neighbouring tracks, and the
+        playlist is only renumbered when that gap is too small.
+        """
+        playlist_tracks = self._playlist_track_model.filter(playlist=self)
+        if exclude_id is not None:
+            playlist_tracks = playlist_tracks.exclude(id=exclude_id)
+
+        neighbours = (
+            await playlist_tracks.order_by("index")
+            .offset(max(index - 1, 0))
+            .limit(2 if index else 1)
+            .values_list("index", flat=True)
+        )
+        if index:
+            before, after = (list(neighbours) + [None])[:2]
+        else:
+            before, after = 0, neighbours[0] if neighbours else None
 
-        new_playlist_tracks = [
-            self._playlist_track_model(playlist=self, track=track) for track in tracks
-        ]
-        playlist_tracks[index:index] = new_playlist_tracks
+        if after is None:
+            return [before + PLAYLIST_TRACK_INDEX_GAP * (i + 1) for i in range(count)]
 
-        # Update playlist track indices
-        for i, playlist_track in enumerate(playlist_tracks):
-            if playlist_track.index != i:
-                playlist_track.index = i
+        if after - before > count:
+            return [
+                before + (after - before) * (i + 1) // (count + 1) for i in range(count)
+            ]
 
-        # Save indices in reverse to avoid unique index validation error
-        for playlist_track in reversed(playlist_tracks):
-            await playlist_track.save()
+        logger.debug(f"Renumbering tracks in {self}")
+        # Negate every index first, so no intermediate row clashes with the
+        # unique (playlist, index) constraint
+        await self._playlist_track_model.filter(playlist=self).update(
+            index=F("index") * -1
+        )
+        renumbered_tracks = list(await playlist_tracks.order_by("-index"))
+        for i, playlist_track in enumerate(renumbered_tracks):
+            # Leave room for the inserted tracks at INDEX
+            position = i + 1 if i < index else i + 1 + count
+            playlist_track.index = position * PLAYLIST_TRACK_INDEX_GAP
+
+        await self._playlist_track_model.bulk_update(
+            renumbered_tracks, fields=["index"], batch_size=PLAYLIST_TRACK_BATCH_SIZE
+        )
+        return [(index + i + 1) * PLAYLIST_TRACK_INDEX_GAP for i in range(count)]
 
     def differs_from(self, other_playlist: type["Playlist"]) -> bool:
         """Return True if the metadata for this playlist matches OTHER_PLAYLIST.
@@ -107,14 +208,52 @@ class Track(Model):
     isrc = fields.CharField(
         max_length=12, null=True, validators=[MinLengthValidator(12)]
     )
+    # ISRC packed by pack_isrc, used to match tracks across libraries
+    isrc_key = fields.BigIntField(null=True)
+    duration = fields.IntField(null=True)  # milliseconds
 
     class Meta:
         abstract = True
-        indexes = ("external_id", "isrc")
+        indexes = ("external_id", "isrc", "isrc_key")
 
     def __str__(self) -> str:
         return f"<{self.__class__.__name__}: {self.external_id}>"
 
+    def _pack_isrc(self) -> None:
+        # Every write path goes through here, so isrc_key always matches isrc
+        self.isrc_key = pack_isrc(self.isrc)
+
+    async def save(self, *args, update_fields=None, **kwargs) -> None:
+        self._pack_isrc()
+        if update_fields is not None:
+            update_fields = list(update_fields)
+            if "isrc" in update_fields and "isrc_key" not in update_fields:
+                update_fields.append("isrc_key")
+
+        await super().save(*args, update_fields=update_fields, **kwargs)
+
+    @classmethod
+    def bulk_create(cls, objects: Iterable[Self], *args, **kwargs):
+        objects = list(objects)
+        for track in objects:
+            track._pack_isrc()
+
+        return super().bulk_create(objects, *args, **kwargs)
+
+    @classmethod
+    def bulk_update(
+        cls, objects: Iterable[Self], fields: Iterable[str], *args, **kwargs
+    ):
+        objects = list(objects)
+        for track in objects:
+            track._pack_isrc()
+
+        fields = list(fields)
+        if "isrc" in fields and "isrc_key" not in fields:
+            fields.append("isrc_key")
+
+        return super().bulk_update(objects, fields, *args, **kwargs)
+
     @transactions.atomic()
     async def set_id_and_save(self) -> None:
         existing_id = await self.__class__.filter(
@@ -128,6 +267,53 @@ class Track(Model):
 
         await self.save(force_update=force_update)
 
+    @classmethod
+    async def bulk_upsert(cls, tracks: List[Self]) -> None:
+        """Save TRACKS, updating existing rows with the same external ID.
+
+        The IDs of the saved rows are set on TRACKS.
+        """
+        meta = cls._meta
+        columns = {
+            field_name: column
+            for field_name, column in meta.fields_db_projection.items()
+            if field_name != meta.pk_attr
+        }
+        column_list = ", ".join(f'"{column}"' for column in columns.values())
+        placeholders = f"({', '.join('?' for _ in columns)})"
+        updates = ", ".join(
+            f'"{column}" = excluded."{column}"'
+            for field_name, column in columns.items()
+            if field_name != "external_id"
+        )
+
+        tracks_by_external_id = {track.external_id: track for track in tracks}
+        for track in tracks_by_external_id.values():
+            track._pack_isrc()
+
+        async with transactions.in_transaction() as connection:
+            for batch in itertools.batched(
+                tracks_by_external_id.values(), SQLITE_MAX_VARIABLES // len(columns)
+            ):
+                values = [
+                    meta.fields_map[field_name].to_db_value(
+                        getattr(track, field_name), track
+                    )
+                    for track in batch
+                    for field_name in columns
+                ]
+                _, rows = await connection.execute_query(
+                    f'INSERT INTO "{meta.db_table}" ({column_list}) '
+                    f"VALUES {', '.join(placeholders for _ in batch)} "
+                    f'ON CONFLICT ("external_id") DO UPDATE SET {updates} '
+                    f'RETURNING "{meta.db_pk_column}", "external_id"',
+                    values,
+                )
+                for track_id, external_id in rows:
+                    track = tracks_by_external_id[external_id]
+                    track.pk = track_id
+                    track._saved_in_db = True
+
     @classmethod
     def in_synced_playlists(cls) -> QuerySet[Self]:
         return cls.filter(
@@ -155,8 +341,22 @@ class Track(Model):
             track_number=track_number,
             disc_number=disc_number,
             isrc=audio.get("TSRC"),
+            duration=cls.read_duration(track_path),
         )
 
+    @staticmethod
+    def read_duration(track_path: Path) -> Optional[int]:
+        try:
+            audio = mutagen.File(track_path)
+        except MutagenError:
+            logger.debug(f"Failed to read duration from {track_path}")
+            return None
+
+        if audio is None or not audio.info.length:
+            return None
+
+        return round(audio.info.length * 1000)
+
 
 class PlaylistTrack(Model):
     playlist: fields.ForeignKeyRelation[Playlist] = fields.ForeignKeyField(
@@ -165,7 +365,8 @@ class PlaylistTrack(Model):
     track: fields.ForeignKeyRelation[Track] = fields.ForeignKeyField(
         "models.Track", related_name="playlist_tracks"
     )
-    index = fields.SmallIntField(validators=[MinValueValidator(0)])
+    # Sparse sort key, see PLAYLIST_TRACK_INDEX_GAP
+    index = fields.IntField(validators=[MinValueValidator(0)])
 
     class Meta:
         abstract = True
@@ -0,0 +1,32 @@
+from typing import Type
+
+from tortoise import fields
+from tortoise.models import Model
+
+from .abstract import Track
+
+
+class TrackMatch(Model):
+    """Fuzzy match between a Spotify and a rekordbox track that share no ISRC."""
+
+    spotify_track = fields.ForeignKeyField(
+        "models.SpotifyTrack", related_name="matches", on_delete=fields.CASCADE
+    )
+    rekordbox_track = fields.ForeignKeyField(
+        "models.RekordboxTrack", related_name="matches", on_delete=fields.CASCADE
+    )
+    score = fields.FloatField()
+
+    class Meta:
+        unique_together = ("spotify_track", "rekordbox_track")
+        indexes = (("rekordbox_track",),)
+
+    @classmethod
+    def track_column(cls, track_model: Type[Track]) -> str:
+        """Return the column holding the ID of the matched TRACK_MODEL track."""
+        for field_name in cls._meta.fk_fields:
+            field = cls._meta.fields_map[field_name]
+            if field.related_model is track_model:
+                return field.source_field
+
+        raise ValueError(f"{cls.__name__} doesn't reference {track_model.__name__}")
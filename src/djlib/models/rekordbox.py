@@ -1,32 +1,92 @@
 import asyncio
+import itertools
 from pathlib import Path
-from typing import Optional, Self
+from typing import List, Optional, Self, Set, Union
 
 from mutagen import MutagenError
 from mutagen.id3 import ID3
 from pyrekordbox.db6.tables import DjmdContent
+from sqlalchemy import Row
 from tortoise import fields
+from tortoise.models import Model
 
 from ..config import Config
+from ..database import SQLITE_MAX_VARIABLES
 from ..logging import logger
+from ..scheduler import Resource, scheduler
 from .abstract import Playlist, PlaylistTrack, Track
 
+# DjmdContent or a row with the same column names and joined artist/album names
+ContentRow = Union[DjmdContent, Row]
+
 
 class RekordboxPlaylist(Playlist):
     external_id = fields.CharField(max_length=255, unique=True)
+    # Track count and highest song/content USNs of the playlist on rekordbox
+    fingerprint = fields.CharField(max_length=255, null=True)
     playlist_tracks: fields.ReverseRelation["RekordboxPlaylistTrack"]
 
+    def differs_from(self, other_playlist: "RekordboxPlaylist") -> bool:
+        return (
+            self.fingerprint is None or self.fingerprint != other_playlist.fingerprint
+        )
+
+    async def update_to_match(
+        self, other_playlist: "RekordboxPlaylist", save=True
+    ) -> None:
+        await super().update_to_match(other_playlist, save=False)
+        self.fingerprint = other_playlist.fingerprint
+        if save:
+            await self.save()
+
 
 class RekordboxTrack(Track):
     external_id = fields.CharField(max_length=255, unique=True)
     path = fields.CharField(max_length=255, unique=True)
+    # Local USN of the rekordbox row this track was converted from
+    rb_local_usn = fields.BigIntField(null=True)
+    # Acoustic fingerprint of the file, computed when it's first compared with an
+    # import and cleared whenever the rekordbox row changes
+    audio_fingerprint = fields.BinaryField(null=True)
+
+    @classmethod
+    async def from_rb_rows(cls, db_tracks: List[ContentRow]) -> List[Self]:
+        """Convert DB_TRACKS, reusing cached tracks whose rekordbox row is unchanged.
+
+        Reused tracks are returned as saved instances, so only tracks without a
+        primary key need to be written back.
+        """
+        cached_tracks = {}
+        for batch in itertools.batched(
+            (db_track.ID for db_track in db_tracks), SQLITE_MAX_VARIABLES
+        ):
+            for track in await cls.filter(external_id__in=batch):
+                cached_tracks[track.external_id] = track
+
+        tracks = []
+        async with asyncio.TaskGroup() as tg:
+            for db_track in db_tracks:
+                track = cached_tracks.get(db_track.ID)
+                if (
+                    track is not None
+                    and track.rb_local_usn is not None
+                    and track.rb_local_usn == db_track.rb_local_usn
+                ):
+                    tracks.append(track)
+                else:
+                    tracks.append(tg.create_task(cls.from_rb(db_track)))
+
+        return [
+            track.result() if isinstance(track, asyncio.Task) else track
+            for track in tracks
+        ]
 
     @classmethod
-    async def from_rb(cls, db_track: DjmdContent) -> Self:
+    async def from_rb(cls, db_track: ContentRow) -> Self:
         # ISRC isn't stored properly by rekordbox,
         # so it must be pulled from the ID3 tag
-        # TODO: Pull isrc tags concurrently
-        isrc = await asyncio.to_thread(cls._read_isrc_tag, db_track.FolderPath)
+        async with scheduler.slot(Resource.FILE_IO):
+            isrc = await asyncio.to_thread(cls._read_isrc_tag, db_track.FolderPath)
         try:
             track_number = int(db_track.TrackNo)
         except TypeError:
@@ -50,13 +110,15 @@ class RekordboxTrack(Track):
         return cls(
             external_id=db_track.ID,
             title=db_track.Title,
-            artist=getattr(db_track.Artist, "Name", None),
-            album=getattr(db_track.Album, "Name", None),
-            album_artist=getattr(db_track.AlbumArtist, "Name", None),
+            artist=db_track.ArtistName,
+            album=db_track.AlbumName,
+            album_artist=db_track.AlbumArtistName,
             track_number=track_number,
             disc_number=disc_number,
             path=Path(db_track.FolderPath),
             isrc=isrc,
+            duration=db_track.Length * 1000 if db_track.Length else None,
+            rb_local_usn=db_track.rb_local_usn,
         )
 
     @classmethod
@@ -79,7 +141,13 @@ class RekordboxTrack(Track):
         track.path = track_path
         return track
 
-    def import_path(self, unique=False) -> Path:
+    def import_path(self, unique=False, taken: Optional[Set[Path]] = None) -> Path:
+        """Return the path this track should be imported to.
+
+        If UNIQUE is True, a numbered suffix is added until the path doesn't clash
+        with an existing file. When TAKEN is given, paths are checked against that
+        set instead of the filesystem.
+        """
         import_path = (
             Config.music_directory
             / str(self.artist)
@@ -91,7 +159,11 @@ class RekordboxTrack(Track):
 
         duplicate_num = 1
         unique_import_path = import_path
-        while unique_import_path.exists():
+        while (
+            unique_import_path in taken
+            if taken is not None
+            else unique_import_path.exists()
+        ):
             unique_import_path = import_path.with_stem(
                 f"{import_path.stem} ({duplicate_num})"
             )
@@ -100,6 +172,13 @@ class RekordboxTrack(Track):
         return unique_import_path
 
 
+class RekordboxSyncState(Model):
+    """State of the rekordbox database as of the last successful refresh."""
+
+    local_usn = fields.BigIntField()
+    database_fingerprint = fields.CharField(max_length=255)
+
+
 class RekordboxPlaylistTrack(PlaylistTrack):
     playlist: fields.ForeignKeyRelation[RekordboxPlaylist] = fields.ForeignKeyField(
         "models.RekordboxPlaylist", related_name="playlist_tracks"
@@ -0,0 +1,156 @@
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+from enum import Enum
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+from .logging import logger
+
+T = TypeVar("T")
+
+
+class Resource(Enum):
+    API = "api"
+    DB = "db"
+    FILE_IO = "file_io"
+
+
+# Most jobs holding each resource at once
+DEFAULT_LIMITS = {
+    Resource.API: 1,  # Spotify rate limits concurrent requests
+    Resource.DB: 4,
+    Resource.FILE_IO: 4,
+}
+
+# Seconds between queue depth reports
+REPORT_INTERVAL = 5
+
+# Priority of the current task, lower runs first. Tasks inherit it from the task
+# that created them.
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("priority", default=0)
+
+
+class _ResourceState:
+    __slots__ = ("limit", "running", "waiters")
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.running = 0
+        self.waiters: List[Tuple[int, int, asyncio.Future]] = []
+
+
+class Scheduler:
+    """Bounds how many jobs use each resource at once.
+
+    Jobs waiting for a resource are started in order of priority, then arrival.
+    """
+
+    def __init__(self, limits: Optional[Dict[Resource, int]] = None):
+        self._resources = {
+            resource: _ResourceState(limit)
+            for resource, limit in (DEFAULT_LIMITS | (limits or {})).items()
+        }
+        self._sequence = itertools.count()
+
+    def __str__(self) -> str:
+        return f"<{self.__class__.__name__}>"
+
+    def queue_depth(self, resource: Resource) -> int:
+        """Return the number of jobs waiting for RESOURCE."""
+        return sum(
+            not future.done() for _, _, future in self._resources[resource].waiters
+        )
+
+    def running(self, resource: Resource) -> int:
+        """Return the number of jobs holding RESOURCE."""
+        return self._resources[resource].running
+
+    def report(self) -> str:
+        return ", ".join(
+            f"{resource.value} {self.queue_depth(resource):,} queued/"
+            f"{state.running} running"
+            for resource, state in self._resources.items()
+        )
+
+    @contextlib.asynccontextmanager
+    async def reporting(self, interval: float = REPORT_INTERVAL) -> AsyncIterator[None]:
+        """Log queue depths every INTERVAL seconds while jobs are queued."""
+
+        async def _report():
+            while True:
+                await asyncio.sleep(interval)
+                if any(self.queue_depth(resource) for resource in self._resources):
+                    logger.info(f"Queue depth: {self.report()}")
+
+        task = asyncio.create_task(_report())
+        try:
+            yield
+        finally:
+            task.cancel()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, resource: Resource) -> AsyncIterator[None]:
+        """Hold one of RESOURCE's slots, waiting for one to free up if needed."""
+        await self._acquire(resource)
+        try:
+            yield
+        finally:
+            self._release(resource)
+
+    async def run(
+        self, function: Callable[..., Awaitable[T]], *args, priority: int = 0
+    ) -> T:
+        """Await FUNCTION(*ARGS), with its resource use queued at PRIORITY.
+
+        Tasks created by FUNCTION inherit PRIORITY.
+        """
+        token = _priority.set(priority)
+        try:
+            return await function(*args)
+        finally:
+            _priority.reset(token)
+
+    async def _acquire(self, resource: Resource) -> None:
+        state = self._resources[resource]
+        # Drop waiters that gave up, so they don't block the fast path
+        while state.waiters and state.waiters[0][2].done():
+            heapq.heappop(state.waiters)
+
+        if state.running < state.limit and not state.waiters:
+            state.running += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(state.waiters, (_priority.get(), next(self._sequence), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Pass on a slot handed over just before being cancelled
+            if future.done() and not future.cancelled():
+                self._release(resource)
+            raise
+
+    def _release(self, resource: Resource) -> None:
+        state = self._resources[resource]
+        state.running -= 1
+        while state.waiters:
+            _, _, future = heapq.heappop(state.waiters)
+            if not future.done():
+                state.running += 1
+                future.set_result(None)
+                break
+
+
+# Shared by everything that uses the network, databases or files
+scheduler = Scheduler()
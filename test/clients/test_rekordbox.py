@@ -0,0 +1,73 @@
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+from djlib.clients.rekordbox import RekordboxClient, playlist_edit_script
+from sqlalchemy import create_engine
+
+
+def apply_edit_script(current, target):
+    script = playlist_edit_script(current, target)
+    result = [
+        target[j] if i is None else current[i] for j, i in enumerate(script.order)
+    ]
+    return script, result
+
+
+def test_playlist_edit_script_unchanged():
+    script, result = apply_edit_script([1, 2, 3], [1, 2, 3])
+    assert result == [1, 2, 3]
+    assert script.deletes == script.inserts == script.moves == []
+
+
+def test_playlist_edit_script_single_move():
+    current = list(range(500))
+    target = current[1:] + [0]
+    script, result = apply_edit_script(current, target)
+    assert result == target
+    assert script.deletes == script.inserts == []
+    assert script.moves == [0]
+
+
+def test_playlist_edit_script_inserts_and_deletes():
+    script, result = apply_edit_script([1, 2, 3, 4], [5, 1, 3, 4, 6])
+    assert result == [5, 1, 3, 4, 6]
+    assert script.deletes == [1]
+    assert script.inserts == [0, 4]
+    assert script.moves == []
+
+
+def test_playlist_edit_script_repeated_ids():
+    script, result = apply_edit_script([1, 2, 1, 3], [1, 1, 3, 2])
+    assert result == [1, 1, 3, 2]
+    assert script.deletes == script.inserts == []
+    assert script.moves == [1]
+
+
+def test_snapshot_of_encrypted_database_includes_wal(tmp_path):
+    sqlcipher3 = pytest.importorskip("sqlcipher3")
+    database_path = tmp_path / "live" / "master.db"
+    database_path.parent.mkdir()
+    engine = create_engine(
+        f"sqlite+pysqlcipher://:secret@/{database_path}", module=sqlcipher3
+    )
+    with engine.begin() as connection:
+        connection.exec_driver_sql("PRAGMA journal_mode = WAL")
+        connection.exec_driver_sql("CREATE TABLE rows (value TEXT)")
+        connection.exec_driver_sql("INSERT INTO rows VALUES ('a')")
+
+    # The pooled connection stays open, so the insert is only in the WAL
+    assert database_path.with_name("master.db-wal").stat().st_size > 0
+
+    snapshot_engine = RekordboxClient._create_snapshot(
+        SimpleNamespace(engine=engine), tmp_path
+    )
+    with snapshot_engine.connect() as connection:
+        rows = connection.exec_driver_sql("SELECT value FROM rows").all()
+    assert rows == [("a",)]
+
+    with pytest.raises(sqlite3.DatabaseError):
+        sqlite3.connect(tmp_path / "master.db").execute("SELECT * FROM rows")
+
+    snapshot_engine.dispose()
+    engine.dispose()
@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+from djlib.clients.rekordbox_database import RekordboxDatabaseActor
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+
+class FakeRegistry:
+    def __init__(self):
+        self.__update_sequence__ = []
+
+
+class FakeDatabase:
+    """Stands in for Rekordbox6Database with a session on a table of rows."""
+
+    def __init__(self):
+        engine = create_engine(
+            "sqlite://",
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool,
+        )
+        self.session = Session(bind=engine)
+        self.session.execute(text("CREATE TABLE rows (value TEXT)"))
+        self.session.commit()
+        self.registry = FakeRegistry()
+        self.commits = 0
+
+    @property
+    def rows(self):
+        return self.session.scalars(text("SELECT value FROM rows")).all()
+
+    def add(self, value):
+        self.session.execute(text("INSERT INTO rows VALUES (:value)"), {"value": value})
+        self.registry.__update_sequence__.append(value)
+
+    def commit(self):
+        self.session.commit()
+        self.registry.__update_sequence__.clear()
+        self.commits += 1
+
+    def rollback(self):
+        self.session.rollback()
+        self.registry.__update_sequence__.clear()
+
+    def close(self):
+        self.session.close()
+
+
+class Stop(BaseException):
+    pass
+
+
+@pytest.fixture
+async def actor():
+    actor = RekordboxDatabaseActor(FakeDatabase)
+    await actor.start()
+    yield actor
+    await actor.stop()
+
+
+async def test_failed_write_is_rolled_back_alone(actor):
+    calls = []
+
+    def write(db, value):
+        calls.append(value)
+        db.add(value)
+        if value == "bad":
+            raise ValueError("bad write")
+
+    def check_registry(db):
+        return list(db.registry.__update_sequence__)
+
+    results = await asyncio.gather(
+        actor.write(write, "a"),
+        actor.write(write, "bad"),
+        actor.write(check_registry),
+        actor.write(write, "b"),
+        return_exceptions=True,
+    )
+    assert results[0] is None
+    assert isinstance(results[1], ValueError)
+    assert results[2] == ["a"]
+    assert results[3] is None
+
+    # Every job ran once, and the batch was committed once
+    assert calls == ["a", "bad", "b"]
+    assert await actor.read(lambda db: db.rows) == ["a", "b"]
+    assert await actor.read(lambda db: db.commits) == 1
+
+
+async def test_failed_commit_saves_no_writes(actor):
+    def fail_commit(db):
+        def commit():
+            raise RuntimeError("Rekordbox is running")
+
+        db.commit = commit
+
+    results = await asyncio.gather(
+        actor.write(lambda db: db.add("a")),
+        actor.write(fail_commit),
+        return_exceptions=True,
+    )
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert await actor.read(lambda db: db.rows) == []
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+async def test_jobs_fail_when_the_thread_dies(actor):
+    def stop(db):
+        raise Stop()
+
+    results = await asyncio.gather(
+        actor.write(stop),
+        actor.write(lambda db: db.add("a")),
+        return_exceptions=True,
+    )
+    assert all(isinstance(result, RuntimeError) for result in results)
+    with pytest.raises(RuntimeError):
+        await actor.read(lambda db: db.rows)
@@ -1,15 +1,14 @@
 import asyncio
+from unittest.mock import patch
 
 import pytest
 from djlib.clients import SpotifyClient
-from djlib.clients.spotify import CONCURRENT_API_CALLS
 from djlib.models import SpotifyPlaylist
 
 
 @pytest.fixture
 async def client():
     async with SpotifyClient() as client:
-        client._api_semaphore = asyncio.Semaphore(CONCURRENT_API_CALLS)
         yield client
 
 
@@ -133,3 +132,59 @@ async def test_get_playlist_tracks(client, spotify_playlist_factory):
         ("Absolution", "USHM91325249"),
         ("Fiesta - Remastered", "USEAX1703135"),  # Relinked from USEAX1100398
     ]
+
+
+def api_item(track_id: str, title: str = "Track", linked: bool = False) -> dict:
+    track = {
+        "id": track_id,
+        "name": f"{title} {track_id}",
+        "track_number": 1,
+        "disc_number": 1,
+        "duration_ms": 200_000,
+        "is_playable": True,
+        "is_local": False,
+        "external_ids": {},
+        "artists": [{"name": "Artist"}],
+        "album": {"name": "Album", "artists": [], "images": []},
+    }
+    if linked:
+        track["linked_from"] = {"id": f"old-{track_id}"}
+
+    return {"track": track, "is_local": False}
+
+
+async def test_get_playlist_tracks_pages_and_relinks(spotify_playlist_factory):
+    playlist = await spotify_playlist_factory(save=False)
+    first_page = {
+        "items": [api_item(str(i), linked=True) for i in range(101)]
+        + [{"track": None, "is_local": False}],
+        "next": "next-page",
+    }
+    pages = {"next-page": {"items": [api_item("last")], "next": None}}
+    requests = []
+
+    async def api_request(endpoint):
+        requests.append(endpoint)
+        await asyncio.sleep(0)
+        if endpoint.startswith("tracks?ids="):
+            track_ids = endpoint.removeprefix("tracks?ids=").split("&")[0].split(",")
+            return {
+                "tracks": [
+                    api_item(track_id, title="Relinked")["track"]
+                    for track_id in track_ids
+                ]
+            }
+
+        return pages.get(endpoint, first_page)
+
+    client = SpotifyClient()
+    with patch.object(client, "_api_request", api_request):
+        titles = [track.title async for track in client.get_playlist_tracks(playlist)]
+
+    assert titles == [f"Relinked {i}" for i in range(101)] + ["Track last"]
+
+    # Tracks are relinked in batches of RELINK_BATCH_SIZE, while the next page is
+    # downloading
+    relink_requests = [request for request in requests if "ids=" in request]
+    assert [request.count(",") + 1 for request in relink_requests] == [50, 50, 1]
+    assert requests.index("next-page") < requests.index(relink_requests[-1])
@@ -91,7 +91,10 @@ async def spotify_track_factory(database):
     async def _spotify_track_factory(save=True, **kwargs) -> SpotifyTrack:
         return await _model_factory(
             SpotifyTrack,
-            {"external_id": random_spotify_id(), "title": random_string(20)},
+            {
+                "external_id": random_spotify_id(),
+                "title": random_string(20),
+            },
             save=save,
             **kwargs,
         )
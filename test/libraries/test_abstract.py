@@ -0,0 +1,210 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from djlib.config import Config
+from djlib.libraries import RekordboxLibrary, SpotifyLibrary
+from djlib.models import PlaylistStatus, RekordboxTrack, TrackMatch
+from mutagen.id3 import ID3, TIT2, TPE1
+
+
+async def test_refresh_saves_playlists_in_chunks(
+    spotify_playlist_factory, spotify_track_factory
+):
+    client_playlists = [
+        await spotify_playlist_factory(save=False, snapshot_id=str(i) * 32)
+        for i in range(2)
+    ]
+    shared_track = await spotify_track_factory(save=False, title="Shared")
+    client_tracks = {
+        client_playlists[0].external_id: [
+            shared_track,
+            await spotify_track_factory(save=False),
+        ],
+        client_playlists[1].external_id: [
+            await spotify_track_factory(save=False),
+            shared_track,
+        ],
+    }
+
+    async def get_playlists():
+        for playlist in client_playlists:
+            yield playlist
+
+    async def get_playlist_tracks(playlist):
+        for track in client_tracks[playlist.external_id]:
+            yield track
+
+    library = SpotifyLibrary()
+    with (
+        patch.object(library._client, "get_playlists", get_playlists),
+        patch.object(library._client, "get_playlist_tracks", get_playlist_tracks),
+        patch("djlib.libraries.abstract.REFRESH_CHUNK_SIZE", 1),
+    ):
+        await library.refresh()
+
+    assert library._track_ids == {}
+    assert await library.tracks.all().count() == 3
+    for client_playlist in client_playlists:
+        playlist = await library.playlists.get(external_id=client_playlist.external_id)
+        assert await playlist.tracks.all().values_list("external_id", flat=True) == [
+            track.external_id for track in client_tracks[playlist.external_id]
+        ]
+
+
+async def test_tracks_not_in(
+    spotify_playlist_factory, spotify_track_factory, rekordbox_track_factory
+):
+    synced_playlist = await spotify_playlist_factory(status=PlaylistStatus.SYNCED)
+    ignored_playlist = await spotify_playlist_factory(status=PlaylistStatus.IGNORED)
+    missing_tracks = [
+        await spotify_track_factory(isrc=f"USRC1760000{i}") for i in range(3)
+    ]
+    present_track = await spotify_track_factory(isrc="USRC17600010")
+    await rekordbox_track_factory(isrc=present_track.isrc)
+    no_isrc_track = await spotify_track_factory()
+    await synced_playlist.add_tracks(*missing_tracks, present_track, no_isrc_track)
+    await ignored_playlist.add_tracks(await spotify_track_factory(isrc="USRC17600011"))
+
+    chunks = [
+        chunk
+        async for chunk in SpotifyLibrary().tracks_not_in(
+            RekordboxLibrary(), chunk_size=2
+        )
+    ]
+    assert [[track.isrc for track in chunk] for chunk in chunks] == [
+        ["USRC17600000", "USRC17600001"],
+        ["USRC17600002"],
+    ]
+
+
+async def test_update_playlists_to_match_source(
+    spotify_playlist_factory,
+    spotify_track_factory,
+    rekordbox_playlist_factory,
+    rekordbox_track_factory,
+):
+    source_tracks = [
+        await spotify_track_factory(isrc=f"USRC1760000{i}") for i in range(3)
+    ]
+    target_tracks = [
+        await rekordbox_track_factory(isrc=track.isrc) for track in source_tracks
+    ]
+    matching = await spotify_playlist_factory(status=PlaylistStatus.SYNCED)
+    await matching.add_tracks(*source_tracks)
+    matched = await rekordbox_playlist_factory(name=matching.name)
+    await matched.add_tracks(*target_tracks)
+    reordered = await spotify_playlist_factory(status=PlaylistStatus.SYNCED)
+    await reordered.add_tracks(*reversed(source_tracks))
+    stale = await rekordbox_playlist_factory(name=reordered.name)
+    await stale.add_tracks(*target_tracks)
+    new = await spotify_playlist_factory(status=PlaylistStatus.SYNCED)
+    await new.add_tracks(source_tracks[0])
+    empty = await rekordbox_playlist_factory(name=new.name)
+
+    library = RekordboxLibrary()
+    with patch.object(library._client, "update_playlist", AsyncMock()) as update:
+        await library.update_playlists_to_match_source(SpotifyLibrary())
+
+    assert sorted(call.args[0].name for call in update.await_args_list) == sorted(
+        [reordered.name, new.name]
+    )
+    assert await stale.tracks.all() == list(reversed(target_tracks))
+    assert await empty.tracks.all() == target_tracks[:1]
+
+    # Existing target playlists are synced, including those already matching
+    for playlist in (matched, stale, empty):
+        assert playlist.status == PlaylistStatus.NEW
+        await playlist.refresh_from_db()
+        assert playlist.status == PlaylistStatus.SYNCED
+
+
+async def test_match_tracks(
+    spotify_playlist_factory,
+    spotify_track_factory,
+    rekordbox_playlist_factory,
+    rekordbox_track_factory,
+):
+    synced_playlist = await spotify_playlist_factory(status=PlaylistStatus.SYNCED)
+    track = await spotify_track_factory(
+        title="Torrid Soul", artist="HVOB", isrc="DEUE11730222"
+    )
+    await synced_playlist.add_tracks(track)
+    local_file = await rekordbox_track_factory(title="Torrid Soul", artist="HVOB")
+    await rekordbox_track_factory(title="Dogs", artist="HVOB")
+
+    source, target = SpotifyLibrary(), RekordboxLibrary()
+    assert await source.match_tracks(target) == 1
+    assert await source.match_tracks(target) == 0
+    match = await TrackMatch.get(spotify_track=track)
+    assert match.rekordbox_track_id == local_file.id
+    assert [chunk async for chunk in source.tracks_not_in(target)] == []
+
+    playlist = await rekordbox_playlist_factory(name=synced_playlist.name)
+    with patch.object(target._client, "update_playlist", AsyncMock()):
+        await target.update_playlists_to_match_source(source)
+    assert await playlist.tracks.all() == [local_file]
+
+
+async def test_search(spotify_track_factory):
+    await spotify_track_factory(title="Torrid Soul", artist="HVOB")
+    await spotify_track_factory(title="Silk", artist="HVOB", album="Silk")
+    track = await spotify_track_factory(title="Dogs", artist="HVOB")
+    await spotify_track_factory(title="Unrelated", artist="Someone")
+
+    library = SpotifyLibrary()
+    assert [track.title for track in await library.search("silk")] == ["Silk"]
+    assert len(await library.search("hvob")) == 3
+    assert len(await library.search("hv", page=2, page_size=2)) == 1
+    assert await library.search("torrid sou") == [
+        await library.tracks.get(title="Torrid Soul")
+    ]
+
+    track.title = "Cats"
+    await track.save()
+    assert await library.search("dogs") == []
+
+
+async def test_import_tracks_skips_failed_moves_and_upserts(
+    tmp_path, rekordbox_track_factory
+):
+    # A stale cached row with the external ID rekordbox gives the new track
+    await rekordbox_track_factory(external_id="1", title="Stale")
+    track_paths = []
+    for artist in ("Artist", "Blocked"):
+        track_path = tmp_path / f"{artist}.mp3"
+        tags = ID3()
+        tags.add(TIT2(text=artist))
+        tags.add(TPE1(text=artist))
+        tags.save(track_path)
+        track_paths.append(track_path)
+
+    # A file where the blocked track's artist directory would go fails its move
+    music_directory = tmp_path / "music"
+    music_directory.mkdir()
+    (music_directory / "Blocked").touch()
+
+    library = RekordboxLibrary()
+    write = AsyncMock(return_value=["1"])
+    library._client._database_actor = SimpleNamespace(write=write)
+    with (
+        patch.object(Config, "music_directory", music_directory),
+        patch("djlib.libraries.rekordbox.fingerprint.available", return_value=False),
+    ):
+        imported_tracks = await library.import_tracks(*track_paths)
+
+    assert [track.title for track in imported_tracks] == ["Artist"]
+    assert write.await_args.args[1] == imported_tracks
+    assert track_paths[1].exists()
+
+    track = await RekordboxTrack.get(external_id="1")
+    assert track.title == "Artist"
+    assert track.path == str(imported_tracks[0].path)
+    assert await RekordboxTrack.all().count() == 1
+
+
+async def test_explain(database):
+    plans = await SpotifyLibrary().explain(RekordboxLibrary())
+    assert "tracks not in <RekordboxLibrary>" in plans
+    for name, plan in plans.items():
+        if name != "tracks with no playlist":
+            assert not any(line.startswith("SCAN spotify") for line in plan), name
@@ -0,0 +1,90 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from djlib.libraries import RekordboxLibrary
+from djlib.models import RekordboxSyncState, RekordboxTrack
+
+
+async def test_refresh_skips_unchanged_database(database):
+    library = RekordboxLibrary()
+    get_database_state = AsyncMock(return_value=(5, "fingerprint"))
+    with (
+        patch.object(library._client, "get_database_state", get_database_state),
+        patch.object(library, "_refresh", AsyncMock()) as refresh,
+    ):
+        await library.refresh()
+        assert refresh.await_count == 1
+        assert library._since_usn is None
+
+        # The same state is skipped, and a new one refreshes from the last USN
+        await library.refresh()
+        assert refresh.await_count == 1
+
+        get_database_state.return_value = (7, "fingerprint")
+        await library.refresh()
+        assert refresh.await_count == 2
+        assert library._since_usn == 5
+
+    sync_state = await RekordboxSyncState.get()
+    assert sync_state.local_usn == 7
+    assert sync_state.database_fingerprint == "fingerprint"
+
+
+@pytest.mark.parametrize("since_usn", [None, 5])
+async def test_refresh_non_playlist_tracks(
+    since_usn, rekordbox_playlist_factory, rekordbox_track_factory
+):
+    playlist = await rekordbox_playlist_factory()
+    playlist_track = await rekordbox_track_factory()
+    await playlist.add_tracks(playlist_track)
+    unchanged_track = await rekordbox_track_factory()
+    changed_track = await rekordbox_track_factory(title="old")
+    stale_track = await rekordbox_track_factory()
+
+    client_tracks = [
+        await rekordbox_track_factory(
+            save=False, external_id=changed_track.external_id, title="new"
+        ),
+        await rekordbox_track_factory(save=False),
+    ]
+    if since_usn is None:
+        client_tracks.append(unchanged_track)
+
+    async def get_non_playlist_tracks(since_usn=None):
+        assert since_usn == library._since_usn
+        for track in client_tracks:
+            yield track
+
+    library = RekordboxLibrary()
+    library._since_usn = since_usn
+    with (
+        patch.object(
+            library._client, "get_non_playlist_tracks", get_non_playlist_tracks
+        ),
+        patch.object(
+            library._client,
+            "get_non_playlist_track_ids",
+            AsyncMock(
+                return_value={
+                    unchanged_track.external_id,
+                    *(track.external_id for track in client_tracks),
+                }
+            ),
+        ),
+    ):
+        await library._refresh_non_playlist_tracks()
+
+    # Stale loose tracks are deleted, but playlist tracks are left alone
+    assert not await RekordboxTrack.filter(pk=stale_track.pk).exists()
+    assert await RekordboxTrack.filter(pk=playlist_track.pk).exists()
+    assert await RekordboxTrack.filter(pk=unchanged_track.pk).exists()
+
+    # Changed tracks keep their IDs, and new tracks are created
+    assert (
+        await RekordboxTrack.get(pk=changed_track.pk).values_list("title", flat=True)
+        == "new"
+    )
+    assert await RekordboxTrack.filter(
+        external_id=client_tracks[1].external_id
+    ).exists()
+    assert await RekordboxTrack.all().count() == 4
@@ -1,4 +1,13 @@
-from djlib.models import Track
+from djlib.models import Track, pack_isrc
+
+
+def test_pack_isrc():
+    assert pack_isrc("DEUE11730222") == pack_isrc("de-ue1-17-30222")
+    assert pack_isrc("DEUE11730222") != pack_isrc("DEUE11730223")
+    assert pack_isrc("ZZZZZ9999999") < 2**63
+    assert pack_isrc("DEUE1173022") is None
+    assert pack_isrc("DEUE1173022X") is None
+    assert pack_isrc(None) is None
 
 
 class TestTrack:
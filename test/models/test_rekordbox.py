@@ -1,3 +1,6 @@
+from pathlib import Path
+from types import SimpleNamespace
+
 from djlib.models import RekordboxTrack
 
 
@@ -41,8 +44,60 @@ class TestRekordboxPlaylist:
             "7",
         ]
 
+    async def test_differs_from(self, rekordbox_playlist_factory):
+        playlist = await rekordbox_playlist_factory()
+        client_playlist = await rekordbox_playlist_factory(
+            save=False, external_id=playlist.external_id, fingerprint="3:5:3"
+        )
+        assert playlist.differs_from(client_playlist)
+
+        await playlist.update_to_match(client_playlist)
+        await playlist.refresh_from_db()
+        assert not playlist.differs_from(client_playlist)
+
+        client_playlist.fingerprint = "2:6:3"
+        assert playlist.differs_from(client_playlist)
+
+
+def rekordbox_row(**kwargs):
+    defaults = {
+        "ID": "1",
+        "Title": "Torrid Soul",
+        "TrackNo": 3,
+        "DiscNo": 1,
+        "FolderPath": "/nonexistent/03 Torrid Soul.mp3",
+        "Length": 263,
+        "rb_local_usn": 1,
+        "ArtistName": None,
+        "AlbumName": None,
+        "AlbumArtistName": None,
+    }
+    return SimpleNamespace(**(defaults | kwargs))
+
 
 class TestRekordboxTrack:
+    async def test_from_rb_rows_reuses_unchanged_tracks(self, rekordbox_track_factory):
+        cached_track = await rekordbox_track_factory(
+            external_id="1", title="Cached", rb_local_usn=5
+        )
+        changed_track = await rekordbox_track_factory(
+            external_id="2", title="Stale", rb_local_usn=5
+        )
+        tracks = await RekordboxTrack.from_rb_rows(
+            [
+                rekordbox_row(ID="1", Title="Cached", rb_local_usn=5),
+                rekordbox_row(ID="2", Title="Fresh", rb_local_usn=6),
+                rekordbox_row(ID="3", Title="New", rb_local_usn=7),
+            ]
+        )
+        assert tracks[0] == cached_track
+        assert tracks[0].pk == cached_track.pk
+        assert tracks[1].pk is None
+        assert (tracks[1].external_id, tracks[1].title) == ("2", "Fresh")
+        assert tracks[1].rb_local_usn == 6
+        assert tracks[2].pk is None
+        assert changed_track.title == "Stale"
+
     def test_from_file(self, track_path):
         track = RekordboxTrack.from_file(track_path)
         assert track.title == "Torrid Soul"
@@ -60,3 +115,19 @@ class TestRekordboxTrack:
         assert str(track.import_path(unique=True)).endswith(
             "music/HVOB/Silk/03 Torrid Soul (2).mp3"
         )
+
+    def test_import_path_with_taken_paths(self, config):
+        track = RekordboxTrack(
+            title="Torrid Soul",
+            artist="HVOB",
+            album="Silk",
+            track_number=3,
+        )
+        track.path = Path("/tmp/DEUE11730222.mp3")
+        import_path = track.import_path()
+        assert track.import_path(unique=True, taken=set()) == import_path
+
+        taken = {import_path, import_path.with_stem("03 Torrid Soul (1)")}
+        assert track.import_path(unique=True, taken=taken) == import_path.with_stem(
+            "03 Torrid Soul (2)"
+        )
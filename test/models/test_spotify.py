@@ -1,4 +1,4 @@
-from djlib.models import PlaylistStatus, SpotifyPlaylist, SpotifyTrack
+from djlib.models import PlaylistStatus, SpotifyPlaylist, SpotifyTrack, pack_isrc
 
 
 def test_differs_from():
@@ -55,6 +55,14 @@ async def test_add_tracks(spotify_playlist_factory, spotify_track_factory):
         "7",
     ]
 
+    track_id = (await spotify_track_factory(title="8")).id
+    await playlist.add_tracks(track_id, index=0)
+    assert await playlist.tracks.all().values_list("title", flat=True) == [
+        "8",
+        "6",
+        "7",
+    ]
+
 
 async def test_set_id_and_save(spotify_track_factory):
     track = await spotify_track_factory(title="Bar", save=False)
@@ -104,3 +112,72 @@ async def test_in_synced_playlists(spotify_playlist_factory, spotify_track_facto
         tuple(await SpotifyTrack.in_synced_playlists().all().order_by("id"))
         == tracks[:3]
     )
+
+
+async def test_bulk_upsert(spotify_track_factory):
+    existing_track = await spotify_track_factory(title="old")
+    updated_track = await spotify_track_factory(
+        save=False, external_id=existing_track.external_id, title="new"
+    )
+    new_track = await spotify_track_factory(save=False)
+
+    await SpotifyTrack.bulk_upsert([updated_track, new_track])
+    assert updated_track.pk == existing_track.pk
+    assert new_track.pk is not None
+    assert (
+        await SpotifyTrack.get(pk=existing_track.pk).values_list("title", flat=True)
+        == "new"
+    )
+    assert await SpotifyTrack.filter(pk=new_track.pk).exists()
+
+
+async def test_writes_pack_isrc(spotify_track_factory):
+    saved_track = await spotify_track_factory(isrc="DEUE11730222")
+    created_track = await spotify_track_factory(save=False, isrc="DEUE11730223")
+    upserted_track = await spotify_track_factory(save=False, isrc="DEUE11730224")
+    await SpotifyTrack.bulk_create([created_track])
+    await SpotifyTrack.bulk_upsert([upserted_track])
+
+    saved_track.isrc = "DEUE11730225"
+    await SpotifyTrack.bulk_update([saved_track], fields=["isrc"])
+
+    for track in (saved_track, created_track, upserted_track):
+        assert await SpotifyTrack.get(external_id=track.external_id).values_list(
+            "isrc_key", flat=True
+        ) == pack_isrc(track.isrc)
+
+
+async def test_add_tracks_renumbers_when_gap_is_full(
+    spotify_playlist_factory, spotify_track_factory
+):
+    playlist = await spotify_playlist_factory()
+    first = await spotify_track_factory(title="first")
+    last = await spotify_track_factory(title="last")
+    await playlist.add_tracks(first, last)
+    titles = ["first", "last"]
+    for i in range(12):
+        await playlist.add_tracks(await spotify_track_factory(title=str(i)), index=1)
+        titles.insert(1, str(i))
+
+    assert await playlist.tracks.all().values_list("title", flat=True) == titles
+
+
+async def test_move_track(spotify_playlist_factory, spotify_track_factory):
+    playlist = await spotify_playlist_factory()
+    tracks = [await spotify_track_factory(title=str(i)) for i in range(4)]
+    await playlist.add_tracks(*tracks)
+
+    await playlist.move_track(0, 2)
+    assert await playlist.tracks.all().values_list("title", flat=True) == [
+        "1",
+        "2",
+        "0",
+        "3",
+    ]
+    await playlist.move_track(3, 0)
+    assert await playlist.tracks.all().values_list("title", flat=True) == [
+        "3",
+        "1",
+        "2",
+        "0",
+    ]
@@ -0,0 +1,152 @@
+import asyncio
+import sqlite3
+from unittest.mock import patch
+
+import pytest
+
+from djlib.config import Config
+from djlib.database import MIGRATIONS, Database, ShadowTable, WriteQueue
+from djlib.models import SpotifyPlaylistTrack, SpotifyTrack, pack_isrc
+from tortoise import Tortoise
+from tortoise.backends.sqlite.client import SqliteTransactionWrapper
+from tortoise.exceptions import OperationalError
+
+from .conftest import random_temporary_path
+
+
+async def test_new_database_is_marked_as_migrated(database):
+    connection = Tortoise.get_connection("default")
+    _, rows = await connection.execute_query("PRAGMA user_version")
+    assert rows[0][0] == len(MIGRATIONS)
+
+
+async def test_migrates_existing_database():
+    database_file = random_temporary_path(".sqlite3")
+    with sqlite3.connect(database_file) as connection:
+        for table in ("rekordboxtrack", "spotifytrack"):
+            connection.execute(
+                f'CREATE TABLE "{table}" ("id" INTEGER PRIMARY KEY, "title" TEXT, '
+                '"artist" TEXT, "album" TEXT, "album_artist" TEXT, "isrc" TEXT)'
+            )
+        connection.execute(
+            'INSERT INTO "rekordboxtrack" ("isrc") VALUES (\'DE-UE1-17-30222\')'
+        )
+        connection.execute(
+            'CREATE TABLE "rekordboxplaylist" ("id" INTEGER PRIMARY KEY, "name" TEXT)'
+        )
+        for table in ("rekordboxplaylisttrack", "spotifyplaylisttrack"):
+            connection.execute(
+                f'CREATE TABLE "{table}" ("id" INTEGER PRIMARY KEY, "index" SMALLINT)'
+            )
+            connection.executemany(
+                f'INSERT INTO "{table}" ("index") VALUES (?)', [(0,), (1,), (2,)]
+            )
+
+    with patch.object(Config, "database_file", new=str(database_file)):
+        async with Database():
+            connection = Tortoise.get_connection("default")
+            _, rows = await connection.execute_query(
+                'SELECT name FROM pragma_table_info("rekordboxtrack")'
+            )
+            assert "rb_local_usn" in [row[0] for row in rows]
+            _, rows = await connection.execute_query(
+                'SELECT "isrc_key" FROM "rekordboxtrack"'
+            )
+            assert rows[0][0] == pack_isrc("DEUE11730222")
+            _, rows = await connection.execute_query(
+                'SELECT "index" FROM "spotifyplaylisttrack" ORDER BY "index"'
+            )
+            assert [row[0] for row in rows] == [1024, 2048, 3072]
+            _, rows = await connection.execute_query("PRAGMA user_version")
+            assert rows[0][0] == len(MIGRATIONS)
+
+    database_file.unlink()
+
+
+async def test_playlist_tracks_query_uses_index(database, spotify_playlist_factory):
+    playlist = await spotify_playlist_factory()
+    plan = await Database.explain(playlist.tracks)
+    assert any("idx_spotifyplaylisttrack_playlist_id_index" in line for line in plan)
+
+
+async def test_write_queue_isolates_failed_writes(spotify_track_factory):
+    tracks = [await spotify_track_factory(save=False) for _ in range(3)]
+    tracks[1].external_id = tracks[0].external_id
+
+    async with WriteQueue() as write_queue:
+        results = await asyncio.gather(
+            *(write_queue.write(track.save) for track in tracks),
+            return_exceptions=True,
+        )
+
+    assert results[0] is None and results[2] is None
+    assert isinstance(results[1], Exception)
+    assert await SpotifyTrack.all().count() == 2
+
+
+async def test_write_queue_fails_writes_when_the_writer_stops(database):
+    async def stop():
+        raise asyncio.CancelledError()
+
+    async def write():
+        return "written"
+
+    write_queue = WriteQueue(batch_size=1)
+    await write_queue.start()
+    results = await asyncio.gather(
+        write_queue.write(stop),
+        write_queue.write(write),
+        return_exceptions=True,
+    )
+    assert all(isinstance(result, RuntimeError) for result in results)
+    with pytest.raises(RuntimeError):
+        await write_queue.write(write)
+
+    await write_queue.close()
+
+
+async def test_shadow_table_swap(spotify_playlist_factory, spotify_track_factory):
+    playlists = [await spotify_playlist_factory() for _ in range(2)]
+    tracks = [await spotify_track_factory() for _ in range(3)]
+    for playlist in playlists:
+        await playlist.add_tracks(*tracks[:2])
+
+    # Swap twice, so the second swap indexes alongside the first one's names
+    for i in range(2):
+        shadow = ShadowTable(SpotifyPlaylistTrack)
+        await shadow.create()
+        await shadow.insert(
+            [
+                SpotifyPlaylistTrack(playlist=playlists[0], track=track, index=j)
+                for j, track in enumerate(reversed(tracks))
+            ]
+        )
+        await shadow.swap("playlist_id", {playlists[0].pk})
+
+    assert await playlists[0].tracks.all() == list(reversed(tracks))
+    assert await playlists[1].tracks.all() == tracks[:2]
+    plan = await Database.explain(playlists[0].tracks)
+    assert any("idx_spotifyplaylisttrack_playlist_id_index" in line for line in plan)
+
+
+async def test_failed_shadow_table_swap_keeps_live_table(
+    spotify_playlist_factory, spotify_track_factory
+):
+    playlist = await spotify_playlist_factory()
+    track = await spotify_track_factory()
+    await playlist.add_tracks(track)
+
+    shadow = ShadowTable(SpotifyPlaylistTrack)
+    await shadow.create()
+    execute_query = SqliteTransactionWrapper.execute_query
+
+    async def fail_renames(self, query, values=None):
+        if query.startswith("ALTER TABLE"):
+            raise OperationalError("rename failed")
+        return await execute_query(self, query, values)
+
+    with patch.object(SqliteTransactionWrapper, "execute_query", fail_renames):
+        with pytest.raises(OperationalError):
+            await shadow.swap("playlist_id", {playlist.pk})
+
+    assert await playlist.tracks.all() == [track]
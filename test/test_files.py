@@ -0,0 +1,31 @@
+import errno
+
+import pytest
+
+from djlib import files
+
+
+@pytest.fixture
+def source(tmp_path):
+    source = tmp_path / "source.mp3"
+    source.write_bytes(b"ID3" + bytes(range(256)) * 10_000)
+    return source
+
+
+async def test_copy_file(source, tmp_path):
+    destination = tmp_path / "destination.mp3"
+    assert await files.copy_file(source, destination) == destination
+    assert destination.read_bytes() == source.read_bytes()
+
+
+async def test_copy_file_falls_back_to_chunked_copy(source, tmp_path, monkeypatch):
+    def unsupported(source, destination):
+        raise OSError(errno.EXDEV, "Not supported")
+
+    monkeypatch.setattr(files, "_reflink", unsupported)
+    monkeypatch.setattr(files, "_hardlink", unsupported)
+    monkeypatch.setattr(files, "COPY_CHUNK_SIZE", 4096)
+    destination = tmp_path / "destination.mp3"
+    await files.copy_file(source, destination)
+    assert destination.read_bytes() == source.read_bytes()
+    assert destination.stat().st_ino != source.stat().st_ino
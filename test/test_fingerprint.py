@@ -0,0 +1,157 @@
+import shutil
+from io import BytesIO
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from djlib.clients import SpotifyClient
+from djlib.fingerprint import (
+    FINGERPRINT_BITS,
+    FINGERPRINT_TAG,
+    MATCH_DISTANCE,
+    FingerprintIndex,
+    fingerprint_samples,
+    fingerprint_tag,
+    read_fingerprint_tag,
+)
+from djlib.libraries import RekordboxLibrary
+from djlib.models import RekordboxTrack, TrackMatch
+from mutagen.id3 import ID3, TIT2, TXXX
+from pydub import AudioSegment
+
+np = pytest.importorskip("numpy")
+
+SAMPLE_RATE = 44100
+
+
+def recording(seed: int, seconds: int = 60) -> "np.ndarray":
+    """Return a sequence of random chords as PCM samples."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(SAMPLE_RATE * seconds // 40) / SAMPLE_RATE
+    return np.concatenate(
+        [
+            sum(np.sin(2 * np.pi * rng.uniform(300, 2000) * t) for _ in range(3))
+            for _ in range(40)
+        ]
+    )
+
+
+def audio_segment(samples: "np.ndarray") -> AudioSegment:
+    return AudioSegment(
+        (samples * 8000).astype(np.int16).tobytes(),
+        frame_rate=SAMPLE_RATE,
+        sample_width=2,
+        channels=1,
+    )
+
+
+def tag_track(path: Path, title: str, samples: "np.ndarray", **frames) -> None:
+    tags = ID3()
+    tags.add(TIT2(text=title))
+    tags.add(fingerprint_tag(fingerprint_samples(samples, SAMPLE_RATE)))
+    for description, text in frames.items():
+        tags.add(TXXX(desc=description, text=text))
+
+    tags.save(path)
+
+
+def test_fingerprints_survive_gain_noise_and_offset():
+    samples = recording(1)
+    fingerprint = fingerprint_samples(samples, SAMPLE_RATE)
+    assert len(fingerprint) * 8 == FINGERPRINT_BITS
+
+    noise = np.random.default_rng(0).normal(scale=0.01, size=len(samples))
+    variants = [
+        fingerprint_samples(0.5 * samples + noise, SAMPLE_RATE),
+        fingerprint_samples(
+            np.concatenate([np.zeros(SAMPLE_RATE // 4), samples]), SAMPLE_RATE
+        ),
+        fingerprint_samples(np.repeat(samples, 2), SAMPLE_RATE, channels=2),
+    ]
+    index = FingerprintIndex(capacity=1)
+    index.add(1, fingerprint)
+    index.add(2, fingerprint_samples(recording(2), SAMPLE_RATE))
+    for variant in variants:
+        track_id, distance = index.nearest(variant)
+        assert track_id == 1
+        assert distance <= MATCH_DISTANCE
+
+    assert index.nearest(variants[0], among=[2])[1] > MATCH_DISTANCE
+    assert fingerprint_samples(samples[:1000], SAMPLE_RATE) is None
+
+
+def test_read_fingerprint_tag(tmp_path):
+    path = tmp_path / "track.mp3"
+    fingerprint = fingerprint_samples(recording(1), SAMPLE_RATE)
+    for text, expected in [
+        (fingerprint.hex(), fingerprint),
+        ("not hex", None),
+        (fingerprint.hex()[:-2], None),
+    ]:
+        tags = ID3()
+        tags.add(TXXX(desc=FINGERPRINT_TAG, text=text))
+        tags.save(path)
+        assert read_fingerprint_tag(path) == expected
+
+    assert read_fingerprint_tag(tmp_path / "missing.mp3") is None
+
+
+async def test_rekordbox_import_skips_duplicates(
+    tmp_path, rekordbox_track_factory, spotify_track_factory
+):
+    samples = recording(1)
+    candidate_path = tmp_path / "candidate.wav"
+    audio_segment(samples).export(candidate_path, format="wav")
+    candidate = await rekordbox_track_factory(path=candidate_path, duration=60_000)
+    spotify_track = await spotify_track_factory()
+
+    # An export of the candidate's recording at a different gain, and another
+    # recording of the same length
+    duplicate_path = tmp_path / "duplicate.mp3"
+    tag_track(
+        duplicate_path,
+        "Duplicate",
+        0.5 * samples,
+        spotify_uris=spotify_track.external_id,
+    )
+    unique_path = tmp_path / "unique.mp3"
+    tag_track(unique_path, "Unique", recording(2))
+
+    async def import_tracks(tracks):
+        for i, track in enumerate(tracks):
+            track.external_id = f"imported-{i}"
+        return tracks
+
+    library = RekordboxLibrary()
+    with (
+        patch.object(RekordboxTrack, "read_duration", return_value=60_000),
+        patch.object(library._client, "import_tracks", import_tracks),
+    ):
+        imported_tracks = await library.import_tracks(duplicate_path, unique_path)
+
+    assert [str(track.title) for track in imported_tracks] == ["Unique"]
+    match = await TrackMatch.get(spotify_track=spotify_track)
+    assert match.rekordbox_track_id == candidate.id
+    assert match.score > 0.75
+
+    # The candidate's fingerprint is kept for later imports
+    await candidate.refresh_from_db()
+    assert candidate.audio_fingerprint is not None
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+async def test_spotify_export_tags_fingerprint(tmp_path, spotify_track_factory):
+    samples = recording(1)
+    stream = BytesIO()
+    audio_segment(samples).export(stream, format="ogg")
+    stream.seek(0)
+    track = await spotify_track_factory(save=False, isrc="QZNJW2349474")
+
+    client = SpotifyClient()
+    with patch.object(client, "_get_track_stream", return_value=stream):
+        export_path = await client.export_track(track, tmp_path)
+
+    index = FingerprintIndex()
+    index.add(1, fingerprint_samples(samples, SAMPLE_RATE))
+    _, distance = index.nearest(read_fingerprint_tag(export_path))
+    assert distance <= MATCH_DISTANCE
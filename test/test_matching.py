@@ -0,0 +1,48 @@
+from djlib.matching import TrackIndex, match_tracks, normalize, score
+from djlib.models import RekordboxTrack, SpotifyTrack
+
+
+def test_normalize():
+    assert normalize("Torrid Soul (feat. Someone)") == "torrid soul"
+    assert normalize("Béyoncé & JAY-Z") == "beyonce and jay z"
+    assert normalize("Dogs - Original Mix") == "dogs"
+    assert normalize("Dogs (Extended Mix)") == "dogs extended mix"
+    assert normalize(None) == ""
+
+
+def test_score():
+    track = SpotifyTrack(title="Torrid Soul", artist="HVOB", duration=263_000)
+    assert score(track, RekordboxTrack(title="Torrid Soul", artist="HVOB")) == 1
+    assert score(track, RekordboxTrack(title="Torrid Soul", duration=264_000)) == 1
+    assert score(track, RekordboxTrack(title="Torrid Soul", duration=300_000)) == 0
+    assert score(track, RekordboxTrack(title="Torrid Soil", artist="HVOB")) < 1
+    assert score(track, RekordboxTrack(title="Dogs", artist="HVOB")) < 0.85
+
+
+def test_index_only_scores_tracks_sharing_a_title_word():
+    targets = [
+        RekordboxTrack(title="Torrid Soul", artist="HVOB"),
+        RekordboxTrack(title="Dogs", artist="HVOB"),
+        RekordboxTrack(title="The Soul of Dogs", artist="Someone"),
+    ]
+    index = TrackIndex(targets)
+    track = SpotifyTrack(title="Torrid Soul", artist="HVOB")
+    assert index.candidates(track) == [targets[0], targets[2]]
+    assert index.best_match(track) == (targets[0], 1)
+    assert index.best_match(SpotifyTrack(title="Unknown")) is None
+
+
+def test_match_tracks_is_one_to_one():
+    tracks = [
+        SpotifyTrack(title="Torrid Soul", artist="HVOB"),
+        SpotifyTrack(title="Torrid Soul (feat. Someone)", artist="HVOB"),
+        SpotifyTrack(title="Dogs", artist="HVOB", isrc_key=1),
+    ]
+    targets = [
+        RekordboxTrack(title="Torrid Soul", artist="HVOB"),
+        RekordboxTrack(title="Dogs", artist="HVOB", isrc_key=2),
+    ]
+    matches = match_tracks(tracks, targets)
+    assert [(track, target) for track, target, _ in matches] == [
+        (tracks[0], targets[0])
+    ]
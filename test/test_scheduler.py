@@ -0,0 +1,41 @@
+import asyncio
+
+from djlib.scheduler import Resource, Scheduler
+
+
+async def test_slots_are_bounded_and_handed_out_by_priority():
+    scheduler = Scheduler({Resource.API: 1})
+    order = []
+    release = asyncio.Event()
+
+    async def job(name):
+        async with scheduler.slot(Resource.API):
+            order.append(name)
+            await release.wait()
+
+    async with asyncio.TaskGroup() as tg:
+        tg.create_task(scheduler.run(job, "first", priority=5))
+        await asyncio.sleep(0)
+        for name, priority in (("low", 3), ("high", 0), ("also low", 3)):
+            tg.create_task(scheduler.run(job, name, priority=priority))
+        cancelled = tg.create_task(scheduler.run(job, "cancelled", priority=0))
+        await asyncio.sleep(0)
+
+        assert scheduler.running(Resource.API) == 1
+        assert scheduler.queue_depth(Resource.API) == 4
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        assert scheduler.queue_depth(Resource.API) == 3
+        release.set()
+
+    assert order == ["first", "high", "low", "also low"]
+    assert scheduler.running(Resource.API) == 0
+    assert scheduler.queue_depth(Resource.API) == 0
+
+
+async def test_resources_are_independent():
+    scheduler = Scheduler({Resource.DB: 1, Resource.FILE_IO: 1})
+    async with scheduler.slot(Resource.DB):
+        async with scheduler.slot(Resource.FILE_IO):
+            assert scheduler.running(Resource.DB) == 1
+            assert scheduler.running(Resource.FILE_IO) == 1